@@ -1,8 +1,26 @@
 import os
+import re
 import json
-import requests  # <--- NEW: Needed to talk to GUVI
+import time
+import asyncio
 import uuid      # <--- NEW: Needed for unique Session IDs
-from groq import Groq
+import hashlib
+import random
+from types import SimpleNamespace
+from rules import check_rules
+from verdict_cache import VerdictCache
+from reporter import GuviReporter
+from extractor import extract_intelligence, merge_intelligence, has_identifiers, GUVI_KEYS
+from sessions import SessionStore
+from tokens import estimate_tokens
+from example_bank import ExampleBank, render_examples
+from local_classifier import LocalClassifier, VerdictLog, DEFAULT_MODEL_PATH, DEFAULT_VERDICT_LOG
+from intel_store import IntelStore, guess_kind
+from live_feed import LiveFeed
+from cassette import Cassette, note_call
+import metrics
+from metrics import stage_timer
+from llm_scheduler import LLMScheduler
 
 # --- CONFIGURATION ---
 API_KEY = os.environ.get("GROQ_API_KEY")
@@ -11,12 +29,120 @@ if not API_KEY:
     # Fallback for local testing if you didn't set env var on laptop
     API_KEY = "gsk_YOUR_ACTUAL_GROQ_KEY_HERE"
 
-client = Groq(api_key=API_KEY)
+# The Groq client is built on first use (groq_async_client()): importing the SDK and setting up its TLS
+# context is the slowest part of importing this module, and a cold start on Render shouldn't pay for it
+# before the port is even open. GROQ_WARMUP=1 builds it right after startup instead.
+# Every call goes through the scheduler below, which also does the retries (not the SDK).
+async_client = None
+GROQ_WARMUP = os.environ.get("GROQ_WARMUP", "1") == "1"
+GROQ_WARMUP_TIMEOUT = float(os.environ.get("GROQ_WARMUP_TIMEOUT", "5"))  # seconds
+
+# Record / replay LLM answers (cassette.py), e.g. for bench/evaluate.py. Off unless a file is given.
+LLM_CASSETTE = os.environ.get("LLM_CASSETTE", "")
+LLM_CASSETTE_MODE = os.environ.get("LLM_CASSETTE_MODE", "replay")                      # record / replay / auto
+LLM_CASSETTE_LATENCY_SCALE = float(os.environ.get("LLM_CASSETTE_LATENCY_SCALE", "1"))  # replayed latency x this
+cassette = Cassette(LLM_CASSETTE, LLM_CASSETTE_MODE, LLM_CASSETTE_LATENCY_SCALE) if LLM_CASSETTE else None
+
+# Cap on LLM calls in flight at once (per worker). Extra requests wait their turn
+# instead of piling onto Groq and all timing out together.
+MAX_CONCURRENT_LLM_CALLS = int(os.environ.get("MAX_CONCURRENT_LLM_CALLS", "16"))
+
+# The LLM scheduler (llm_scheduler.py): quota-aware queue, retries, circuit breaker, coalescing
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", "0.5"))   # seconds, doubled per attempt (full jitter)
+LLM_BACKOFF_CAP = float(os.environ.get("LLM_BACKOFF_CAP", "8"))
+LLM_CIRCUIT_FAILURES = int(os.environ.get("LLM_CIRCUIT_FAILURES", "5"))       # failed calls in a row to open it
+LLM_CIRCUIT_RESET = float(os.environ.get("LLM_CIRCUIT_RESET", "30"))          # seconds before a probe call
+LLM_COALESCE = os.environ.get("LLM_COALESCE", "1") == "1"                    # identical in-flight calls share one
+LLM_PRIORITY = os.environ.get("LLM_PRIORITY", "gatekeeper")                   # which goes first: gatekeeper / higgins
+LLM_DEGRADED_FALLBACK = os.environ.get("LLM_DEGRADED_FALLBACK", "1") == "1"  # local verdict / stalling reply if the LLM is down
+LLM_COMPLETION_TOKEN_ESTIMATE = 200  # reserved from the token quota per call, on top of the prompt
+
+llm_scheduler = LLMScheduler(
+    max_concurrent=MAX_CONCURRENT_LLM_CALLS,
+    max_retries=LLM_MAX_RETRIES,
+    backoff_base=LLM_BACKOFF_BASE,
+    backoff_cap=LLM_BACKOFF_CAP,
+    failure_threshold=LLM_CIRCUIT_FAILURES,
+    reset_timeout=LLM_CIRCUIT_RESET,
+    coalesce=LLM_COALESCE,
+    retryable_errors=(),  # set to Groq's connection / status errors when the client is built
+)
+
+# Models. With GATEKEEPER_ROUTING=1 the Gatekeeper asks the small model first and only escalates to
+# GATEKEEPER_MODEL when the answer is malformed or its confidence is below GATEKEEPER_ESCALATION_CONFIDENCE.
+GATEKEEPER_MODEL = os.environ.get("GATEKEEPER_MODEL", "llama-3.3-70b-versatile")
+GATEKEEPER_SMALL_MODEL = os.environ.get("GATEKEEPER_SMALL_MODEL", "llama-3.1-8b-instant")
+GATEKEEPER_ROUTING = os.environ.get("GATEKEEPER_ROUTING", "0") == "1"
+GATEKEEPER_ESCALATION_CONFIDENCE = float(os.environ.get("GATEKEEPER_ESCALATION_CONFIDENCE", "80"))  # 0-100
+HIGGINS_MODEL = os.environ.get("HIGGINS_MODEL", "llama-3.3-70b-versatile")
+
+# How /chat uses the LLM once the Gatekeeper has to be asked:
+#   sequential  - Gatekeeper, then Mrs. Higgins only for SCAM (cheapest)
+#   speculative - both at once, her reply is cancelled / thrown away if the verdict is SAFE
+#   single_call - one prompt returns the verdict and her reply together
+PIPELINE_MODE = os.environ.get("PIPELINE_MODE", "sequential")
+if PIPELINE_MODE not in ("sequential", "speculative", "single_call"):
+    raise ValueError(f"PIPELINE_MODE must be sequential, speculative or single_call, got {PIPELINE_MODE!r}")
+
+# Let the local rule engine (rules.py) decide obvious messages before the Gatekeeper LLM
+RULE_ENGINE_ENABLED = os.environ.get("RULE_ENGINE_ENABLED", "1") == "1"
+
+# Reuse Gatekeeper verdicts for repeated / near-duplicate scam templates (verdict_cache.py)
+VERDICT_CACHE_SIZE = int(os.environ.get("VERDICT_CACHE_SIZE", "10000"))  # 0 disables the cache
+VERDICT_CACHE_TTL = int(os.environ.get("VERDICT_CACHE_TTL", "3600"))     # seconds
+VERDICT_CACHE_NEAR_THRESHOLD = float(os.environ.get("VERDICT_CACHE_NEAR_THRESHOLD", "0.7"))  # Jaccard, 0 = exact only
+
+# GUVI reporting runs on a background worker (reporter.py). Point the URL at a local stub for tests.
+GUVI_REPORT_URL = os.environ.get("GUVI_REPORT_URL", "https://hackathon.guvi.in/api/updateHoneyPotFinalResult")  # "" = off
+GUVI_REPORT_TIMEOUT = float(os.environ.get("GUVI_REPORT_TIMEOUT", "10"))       # seconds per attempt
+GUVI_REPORT_MAX_RETRIES = int(os.environ.get("GUVI_REPORT_MAX_RETRIES", "4"))
+GUVI_REPORT_QUEUE_SIZE = int(os.environ.get("GUVI_REPORT_QUEUE_SIZE", "1000"))
+GUVI_REPORT_SPILL_FILE = os.environ.get("GUVI_REPORT_SPILL_FILE", "guvi_spill.jsonl")  # overflow / undeliverable reports
+
+# Identifiers always come from the local extractor (extractor.py). With this on, Mrs. Higgins also
+# returns her own extracted_intelligence and we merge the validated items. Off = smaller, faster prompt.
+HIGGINS_LLM_EXTRACTION = os.environ.get("HIGGINS_LLM_EXTRACTION", "1") == "1"
+
+# Few-shot retrieval: inject only the k most similar SAFE + SCAM examples into the Gatekeeper prompt
+# (0 = send the whole example bank every time, like before)
+GATEKEEPER_FEW_SHOT_K = int(os.environ.get("GATEKEEPER_FEW_SHOT_K", "4"))
+GATEKEEPER_BATCH_EXAMPLE_LIMIT = int(os.environ.get("GATEKEEPER_BATCH_EXAMPLE_LIMIT", "12"))  # per label, per batch
+
+# Conversation memory per client sessionId (sessions.py)
+SESSION_MAX_SESSIONS = int(os.environ.get("SESSION_MAX_SESSIONS", "10000"))
+SESSION_IDLE_TIMEOUT = int(os.environ.get("SESSION_IDLE_TIMEOUT", "1800"))           # seconds
+SESSION_MEMORY_CAP_MB = float(os.environ.get("SESSION_MEMORY_CAP_MB", "64"))         # whole store
+SESSION_HISTORY_TOKEN_BUDGET = int(os.environ.get("SESSION_HISTORY_TOKEN_BUDGET", "600"))  # history in the Higgins prompt
+
+# /chat/batch packs many messages into one Gatekeeper call, up to this many (estimated) input tokens
+BATCH_TOKEN_BUDGET = int(os.environ.get("BATCH_TOKEN_BUDGET", "4000"))
+BATCH_MAX_MESSAGES = int(os.environ.get("BATCH_MAX_MESSAGES", "40"))
+
+# Local classifier tier (local_classifier.py): decides confident messages before the Gatekeeper LLM.
+# Off until a model has been trained with `python local_classifier.py train`.
+LOCAL_CLASSIFIER_PATH = os.environ.get("LOCAL_CLASSIFIER_PATH", DEFAULT_MODEL_PATH)
+LOCAL_CLASSIFIER_THRESHOLD = float(os.environ.get("LOCAL_CLASSIFIER_THRESHOLD", "0.95"))  # P(label) needed to skip the LLM
+GATEKEEPER_VERDICT_LOG = os.environ.get("GATEKEEPER_VERDICT_LOG", DEFAULT_VERDICT_LOG)  # training data, "" = off
+
+# Every scammer identifier is kept in a SQLite database (intel_store.py) and repeats from other
+# sessions are flagged in the response. Writes are batched on a background thread.
+INTEL_STORE_PATH = os.environ.get("INTEL_STORE_PATH", "intelligence.db")  # "" = in memory only
+INTEL_STORE_MEMORY_SIZE = int(os.environ.get("INTEL_STORE_MEMORY_SIZE", "100000"))  # identifiers indexed in memory
+INTEL_STORE_QUEUE_SIZE = int(os.environ.get("INTEL_STORE_QUEUE_SIZE", "10000"))
+INTEL_STORE_BATCH_SIZE = int(os.environ.get("INTEL_STORE_BATCH_SIZE", "500"))
+INTEL_STORE_FLUSH_SECONDS = float(os.environ.get("INTEL_STORE_FLUSH_SECONDS", "0.5"))
+
+# Live feed (live_feed.py): every classification / extraction is broadcast to the dashboards on GET /feed
+FEED_HISTORY_SIZE = int(os.environ.get("FEED_HISTORY_SIZE", "200"))        # recent events replayed to late joiners
+FEED_BUFFER_SIZE = int(os.environ.get("FEED_BUFFER_SIZE", "100"))          # per dashboard, before its drop policy kicks in
+FEED_MAX_SUBSCRIBERS = int(os.environ.get("FEED_MAX_SUBSCRIBERS", "50"))
+FEED_MESSAGE_CHARS = int(os.environ.get("FEED_MESSAGE_CHARS", "280"))      # scammer text is cut to this in events
 
 # ==============================================================================
 # 1. THE GATEKEEPER (CLASSIFIER)
 # ==============================================================================
-GATEKEEPER_PROMPT = """
+GATEKEEPER_INSTRUCTIONS = """
 You are a Cyber-Security Fraud Detection System.
 Your job is to classify incoming messages as either "SAFE" or "SCAM".
 
@@ -41,28 +167,15 @@ Mark as SAFE if it meets these criteria AND lacks "Poison Pills":
 - **Delivery Verification:** If a message references a "Package" or "Delivery" and asks you to enter/show a code on a PHYSICAL device (like a delivery partner's handheld scanner) to receive an item, it is **SAFE**.
 - **Context:** Genuine delivery codes do not include links or ask you to call a 10-digit mobile number.
 
-### TRAINING DATA (Use these examples to decide):
-[GENUINE / SAFE EXAMPLES]
-- "Alert: Rs. 1,450.00 debited from HDFC Bank Credit Card XX4019. Avl Lmt: Rs. 1,24,000." (Reason: Masked numbers, purely informational)
-- "384921 is your OTP for transaction of Rs. 2,000.00. Do NOT share this OTP." (Reason: Warns NOT to share)
-- "Hi Ria, how are you? Are we still on for dinner?" (Reason: Personal context)
-- "Pre-approved Personal Loan. Login to the Mobile Banking App to check." (Reason: Directs to official App, not a link)
-- "Dear Customer, UPI services will be under scheduled maintenance from 02:00 AM to 04:00 AM." (Reason: Informational only)
-- "Rs. 1000 off with code CUPID. Tira sale ends tonight!" (Reason: Verified Header + Marketing Context)
-- "Tira: Flat 50% off! Shop now on the App: mnge.co/xyz" (Reason: Verified Header + App Link).
-- "Transaction OTP is 8932. Do not share this with anyone." (Reason: Informational).
-
-[SCAM EXAMPLES]
-- "Your SBI YONO account will be blocked within 24 hours. Click here: http://bit.ly/sbi-kyc" (Reason: Urgency + suspicious link)
-- "Electricity power will be disconnected tonight at 9:30 PM. Call 98XXX-XXXXX." (Reason: Threat + Personal number)
-- "I mistakenly sent Rs. 5000 to your PhonePe. Please approve the request." (Reason: Guilt/Greed vector)
-- "Hello, is this Mr. Sharma? ... Oh sorry, I am Elena, I run a business." (Reason: Pig Butchering/Wrong Number scam)
-- "Final Reminder: Invoice #3349 Overdue. Download attached PDF.exe" (Reason: Phishing attachment)
-- "Tira sale end tonight. We will call you. Share OTP with us." (Reason: Requesting OTP sharing).
-- "Amazon delivery attempt failed. Call this number." (Reason: CTA is to call a personal number).
-- "HDFC: KYC Update pending. Click bit.ly/kyc" (Reason: Bad Link).
-
-### OUTPUT FORMAT:
+"""
+
+# The SAFE/SCAM training examples live in data/gatekeeper_examples.jsonl (example_bank.py)
+with metrics.startup_phase("example_bank"):
+    example_bank = ExampleBank.load()
+GATEKEEPER_EXAMPLES = render_examples(example_bank.examples)
+GATEKEEPER_RULES = GATEKEEPER_INSTRUCTIONS + GATEKEEPER_EXAMPLES
+
+GATEKEEPER_OUTPUT = """### OUTPUT FORMAT:
 Return ONLY a JSON object:
 { 
   "classification": "SAFE" or "SCAM", 
@@ -71,10 +184,59 @@ Return ONLY a JSON object:
 }
 """
 
+GATEKEEPER_PROMPT = GATEKEEPER_RULES + GATEKEEPER_OUTPUT
+
+# Batch mode: the rules + examples are sent once for many messages (/chat/batch)
+GATEKEEPER_BATCH_OUTPUT = """### OUTPUT FORMAT:
+You will receive a JSON list of messages, each with an "index". Classify EACH message on its own
+(they are unrelated). Return ONLY a JSON object with one result per index:
+{
+  "results": [
+    { "index": 0, "classification": "SAFE" or "SCAM", "reason": "Short explanation of why", "confidence": 0-100 }
+  ]
+}
+"""
+
+GATEKEEPER_BATCH_PROMPT = GATEKEEPER_RULES + GATEKEEPER_BATCH_OUTPUT
+
+def gatekeeper_prompt_for(user_text, k=None):
+    # Rules + only the k most similar SAFE and SCAM examples (k <= 0 = every example)
+    k = GATEKEEPER_FEW_SHOT_K if k is None else k
+    if k <= 0:
+        return GATEKEEPER_PROMPT
+    return GATEKEEPER_INSTRUCTIONS + render_examples(example_bank.select(user_text, k)) + GATEKEEPER_OUTPUT
+
+def gatekeeper_batch_prompt_for(texts, k=None):
+    k = GATEKEEPER_FEW_SHOT_K if k is None else k
+    if k <= 0:
+        return GATEKEEPER_BATCH_PROMPT
+    examples = example_bank.select_many(texts, k, limit_per_label=GATEKEEPER_BATCH_EXAMPLE_LIMIT)
+    return GATEKEEPER_INSTRUCTIONS + render_examples(examples) + GATEKEEPER_BATCH_OUTPUT
+
+# Verdict cache for the Gatekeeper, tagged with the prompt it was built under
+def prompt_version(prompt):
+    return hashlib.sha1(prompt.encode()).hexdigest()[:12]
+
+def gatekeeper_version():
+    # Everything that can change a Gatekeeper verdict: prompt, example bank, few-shot k, models
+    routing = f"{GATEKEEPER_SMALL_MODEL}>{GATEKEEPER_ESCALATION_CONFIDENCE:g}>" if GATEKEEPER_ROUTING else ""
+    return prompt_version(f"{GATEKEEPER_PROMPT}|few_shot_k={GATEKEEPER_FEW_SHOT_K}|models={routing}{GATEKEEPER_MODEL}")
+
+with metrics.startup_phase("local_classifier"):
+    local_classifier = LocalClassifier.load(LOCAL_CLASSIFIER_PATH, LOCAL_CLASSIFIER_THRESHOLD)
+verdict_log = VerdictLog(GATEKEEPER_VERDICT_LOG)  # appended from a background thread
+
+verdict_cache = VerdictCache(
+    max_size=VERDICT_CACHE_SIZE,
+    ttl=VERDICT_CACHE_TTL,
+    near_threshold=VERDICT_CACHE_NEAR_THRESHOLD,
+    prompt_version=gatekeeper_version(),
+)
+
 # ==============================================================================
 # 2. THE AGENT (MRS. HIGGINS) - SMART & NATURAL
 # ==============================================================================
-HIGGINS_PROMPT = """
+HIGGINS_PERSONA = """
 You are "Mrs. Higgins", a 72-year-old grandmother. You are interacting with a CONFIRMED SCAMMER.
 
 ### YOUR HIDDEN MISSION (THE CYBER-AGENT):
@@ -115,7 +277,9 @@ Your goal is to **EXTRACT PERSONAL IDENTIFIERS** (Phone Numbers, UPI IDs, Bank D
    - Address: "16th bungalow, Hillroad colony, Bandra"
    - Phone: "8765890023"
    - Bank: "SBI"
-   
+"""
+
+HIGGINS_OUTPUT_FULL = """   
 OUTPUT JSON ONLY:
 {
   "reply": "Your response as Mrs. Higgins",
@@ -130,95 +294,908 @@ OUTPUT JSON ONLY:
 }
 """
 
+# Identifiers are extracted locally, so she only has to write the reply
+HIGGINS_OUTPUT_COMPACT = """   
+OUTPUT JSON ONLY:
+{
+  "reply": "Your response as Mrs. Higgins",
+  "agentNotes": "Brief strategy note"
+}
+"""
+
+HIGGINS_PROMPT = HIGGINS_PERSONA + (HIGGINS_OUTPUT_FULL if HIGGINS_LLM_EXTRACTION else HIGGINS_OUTPUT_COMPACT)
+
+# Speculative mode: she starts before the Gatekeeper has said why it is a scam
+SPECULATIVE_REASON = "Not analysed yet - read the scammer's message yourself."
+
+# Single-call mode: Gatekeeper rules + Mrs. Higgins in one prompt (PIPELINE_MODE=single_call)
+SINGLE_CALL_TASK = """
+### YOUR JOB HAS TWO STEPS:
+1. Classify the incoming message as SAFE or SCAM using the rules and examples above.
+2. ONLY if it is a SCAM, reply to it as Mrs. Higgins (described below). If it is SAFE, "reply" is null.
+
+### MRS. HIGGINS (ONLY FOR SCAMS):
+"""
+
+SINGLE_CALL_OUTPUT = """
+OUTPUT JSON ONLY:
+{
+  "classification": "SAFE" or "SCAM",
+  "reason": "Short explanation of why",
+  "confidence": 0-100,
+  "reply": "Your response as Mrs. Higgins, or null if SAFE",
+""" + ("""  "extracted_intelligence": {
+      "bankAccounts": ["..."],
+      "upiIds": ["..."],
+      "phishingLinks": ["..."],
+      "phoneNumbers": ["..."],
+      "suspiciousKeywords": ["..."]
+  },
+""" if HIGGINS_LLM_EXTRACTION else "") + """  "agentNotes": "Brief strategy note"
+}
+"""
+
+def single_call_prompt_for(user_text):
+    examples = render_examples(example_bank.select(user_text, GATEKEEPER_FEW_SHOT_K)) if GATEKEEPER_FEW_SHOT_K > 0 else GATEKEEPER_EXAMPLES
+    return GATEKEEPER_INSTRUCTIONS + examples + SINGLE_CALL_TASK + HIGGINS_PERSONA + SINGLE_CALL_OUTPUT
+
 # ==============================================================================
 # 3. HELPER FUNCTION
 # ==============================================================================
-def get_llm_response(system_prompt, user_input, model="llama-3.3-70b-versatile"):
+def priority_for(stage):
+    # Lower runs first. Speculative replies always come last - they may be thrown away.
+    if stage.endswith("_speculative"):
+        return 2
+    is_higgins = stage.startswith("higgins")
+    return int(is_higgins) if LLM_PRIORITY == "gatekeeper" else int(not is_higgins)
+
+def llm_call_key(model, system_prompt, user_input):
+    return hashlib.sha1(f"{model}\0{system_prompt}\0{user_input}".encode()).hexdigest()
+
+def parse_llm_json(content, stage):
+    # Kept apart from the API call so /metrics can tell "Groq failed" from "Groq sent bad JSON"
+    with stage_timer("json_parse"):
+        try:
+            return json.loads(content)
+        except (TypeError, ValueError) as e:
+            metrics.JSON_ERRORS.inc(stage=stage)
+            print(f"LLM Error: invalid JSON from {stage}: {e}")
+            return None
+
+def groq_async_client():
+    global async_client
+    if async_client is None:
+        with metrics.startup_phase("groq_async_client"):
+            import groq
+            async_client = groq.AsyncGroq(api_key=API_KEY, max_retries=0)
+            llm_scheduler.retryable_errors = (groq.APIConnectionError, groq.APIStatusError)  # includes timeouts and 429s
+    return async_client
+
+async def warm_up():
+    """
+    Builds the async Groq client (on a thread: importing the SDK would stall the event loop) and
+    opens its connection (DNS + TLS) with a models list call, which costs no tokens, so the first
+    real message doesn't pay for either. Failures are only logged.
+    """
+    started = time.perf_counter()
+    try:
+        groq = await asyncio.to_thread(groq_async_client)
+        await asyncio.wait_for(groq.models.list(), GROQ_WARMUP_TIMEOUT)
+    except Exception as e:
+        print(f"Groq warm-up failed (the first message will connect instead): {e}")
+    metrics.STARTUP["groq_warmup"] = time.perf_counter() - started
+
+def replayed_call(key, stage):
+    # The cassette's answer for this call (None = make the real one); raises CassetteMiss in replay mode
+    if not cassette:
+        return None
+    entry = cassette.lookup(key)
+    if entry:
+        usage = SimpleNamespace(**entry["usage"])
+        metrics.record_usage(stage, usage)
+        note_call(stage, entry["model"], usage, entry.get("latency_ms", 0) / 1000, "cassette")  # as recorded
+    return entry
+
+def finished_call(key, model, stage, content, usage, seconds):
+    # A real call completed: count its tokens and record it on the cassette (record / auto mode)
+    metrics.record_usage(stage, usage)
+    note_call(stage, model, usage, seconds, "live")
+    if cassette:
+        cassette.record(key, model, stage, content, usage, seconds)
+
+async def get_llm_response_async(system_prompt, user_input, model="llama-3.3-70b-versatile", stage="llm"):
+    # The only way to Groq: awaits it so the event loop keeps serving other requests, and goes through
+    # the scheduler - queued by priority and quota, retried, and shared with identical calls already in flight.
+    key = llm_call_key(model, system_prompt, user_input)
+
+    async def call():
+        entry = replayed_call(key, stage)
+        if entry:
+            with stage_timer(stage):
+                await asyncio.sleep(cassette.delay(entry))
+            return parse_llm_json(entry["content"], stage), None
+        with stage_timer(stage):
+            started = time.perf_counter()
+            raw = await groq_async_client().chat.completions.with_raw_response.create(
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_input}
+                ],
+                model=model,
+                response_format={"type": "json_object"}
+            )
+        completion = await raw.parse()
+        content = completion.choices[0].message.content
+        finished_call(key, model, stage, content, completion.usage, time.perf_counter() - started)
+        return parse_llm_json(content, stage), raw.headers
+
     try:
-        completion = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_input}
-            ],
-            model=model,
-            response_format={"type": "json_object"}
+        return await llm_scheduler.run(
+            call,
+            priority=priority_for(stage),
+            token_cost=estimate_tokens(system_prompt) + estimate_tokens(user_input) + LLM_COMPLETION_TOKEN_ESTIMATE,
+            key=key,
         )
-        return json.loads(completion.choices[0].message.content)
     except Exception as e:
+        metrics.LLM_ERRORS.inc(stage=stage)
         print(f"LLM Error: {e}")
         return None
 
+async def stream_llm_response_async(system_prompt, user_input, model="llama-3.3-70b-versatile", stage="llm"):
+    # Yields the raw JSON text as Groq produces it (caller parses the whole thing at the end).
+    # Takes a scheduler slot, but isn't retried: part of the reply may already be on screen.
+    token_cost = estimate_tokens(system_prompt) + estimate_tokens(user_input) + LLM_COMPLETION_TOKEN_ESTIMATE
+    key = llm_call_key(model, system_prompt, user_input)
+    async with llm_scheduler.slot(priority_for(stage), token_cost):
+        try:
+            entry = replayed_call(key, stage)
+            if entry:
+                # A recorded answer comes back in one piece, after its recorded latency
+                with stage_timer(stage):
+                    await asyncio.sleep(cassette.delay(entry))
+                yield entry["content"]
+                return
+            with stage_timer(stage):
+                started = time.perf_counter()
+                raw = await groq_async_client().chat.completions.with_raw_response.create(
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_input}
+                    ],
+                    model=model,
+                    response_format={"type": "json_object"},
+                    stream=True
+                )
+                llm_scheduler.update_quota(raw.headers)
+                stream = await raw.parse()
+                pieces, usage = [], None
+                async for chunk in stream:
+                    # Groq puts the token counts on the last chunk (x_groq.usage)
+                    usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if not pieces:
+                            metrics.observe_stage(f"{stage}_first_token", time.perf_counter() - started)
+                        pieces.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+            finished_call(key, model, stage, "".join(pieces), usage, time.perf_counter() - started)
+        except Exception:
+            metrics.LLM_ERRORS.inc(stage=stage)
+            raise
+
+class ReplyStreamParser:
+    """
+    Pulls the "reply" string out of a JSON object while it is still being streamed,
+    so the UI can show Mrs. Higgins typing token by token. feed() returns the newly
+    decoded reply text (may be "").
+    """
+    START = re.compile(r'"reply"\s*:\s*"')
+    ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = None  # index just after the opening quote, once found
+        self.done = False
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        if self.done:
+            return ""
+        if self.position is None:
+            match = self.START.search(self.buffer)
+            if not match:
+                return ""
+            self.position = match.end()
+
+        out = []
+        i = self.position
+        while i < len(self.buffer):
+            char = self.buffer[i]
+            if char == '"':
+                self.done = True
+                i += 1
+                break
+            if char == "\\":
+                if i + 1 >= len(self.buffer):
+                    break  # escape split across chunks - wait for more
+                code = self.buffer[i + 1]
+                if code == "u":
+                    # \uXXXX, or a surrogate pair \uD83D\uDE00 for emoji
+                    width = 12 if self.buffer[i + 2:i + 3].lower() == "d" and self.buffer[i + 3:i + 4].lower() in "89ab" else 6
+                    if i + width > len(self.buffer):
+                        break
+                    out.append(json.loads(f'"{self.buffer[i:i + width]}"'))
+                    i += width
+                    continue
+                out.append(self.ESCAPES.get(code, code))
+                i += 2
+                continue
+            out.append(char)
+            i += 1
+        self.position = i
+        return "".join(out)
+
 # ==============================================================================
 # 4. THE REPORTER (SENDS DATA TO GUVI)
 # ==============================================================================
-def send_to_guvi(intelligence, notes):
-    # This is the endpoint provided in the Hackathon instructions
-    url = "https://hackathon.guvi.in/api/updateHoneyPotFinalResult"
-    
+guvi_reporter = GuviReporter(
+    GUVI_REPORT_URL,
+    queue_size=GUVI_REPORT_QUEUE_SIZE,
+    spill_file=GUVI_REPORT_SPILL_FILE,
+    timeout=GUVI_REPORT_TIMEOUT,
+    max_retries=GUVI_REPORT_MAX_RETRIES,
+)
+
+session_store = SessionStore(
+    max_sessions=SESSION_MAX_SESSIONS,
+    idle_timeout=SESSION_IDLE_TIMEOUT,
+    memory_cap_bytes=int(SESSION_MEMORY_CAP_MB * 1024 * 1024),
+    history_token_budget=SESSION_HISTORY_TOKEN_BUDGET,
+)
+
+with metrics.startup_phase("intel_store"):
+    intel_store = IntelStore(
+        INTEL_STORE_PATH,
+        memory_size=INTEL_STORE_MEMORY_SIZE,
+        queue_size=INTEL_STORE_QUEUE_SIZE,
+        batch_size=INTEL_STORE_BATCH_SIZE,
+        flush_interval=INTEL_STORE_FLUSH_SECONDS,
+    )
+
+live_feed = LiveFeed(history_size=FEED_HISTORY_SIZE, buffer_size=FEED_BUFFER_SIZE, max_subscribers=FEED_MAX_SUBSCRIBERS)
+
+def feed_message(user_text):
+    return user_text if len(user_text) <= FEED_MESSAGE_CHARS else user_text[:FEED_MESSAGE_CHARS] + "..."
+
+def announce_decision(user_text, verdict, decided_by, session=None, **extra):
+    # Counts who decided (/metrics) and tells the dashboards (/feed) as soon as the verdict is known
+    metrics.record_decision(decided_by)
+    live_feed.publish("classification", {
+        "sessionId": session.session_id if session else None,
+        "message": feed_message(user_text),
+        "classification": verdict.get("classification", "SAFE").upper() if verdict else "UNKNOWN",
+        "reason": verdict.get("reason") if verdict else None,
+        "decided_by": decided_by,
+        "model": verdict.get("model") if verdict else None,
+        **extra,
+    })
+
+def announce_result(user_text, result, session_id=None, **extra):
+    # The finished message (reply, intelligence, repeats) for the dashboards
+    live_feed.publish("extraction", {
+        "sessionId": result.get("sessionId") or session_id,
+        "message": feed_message(user_text),
+        **{key: result.get(key) for key in ("status", "classification", "reply", "intelligence", "repeat_identifiers", "decided_by")},
+        **extra,
+    })
+
+def record_sightings(intelligence, session=None):
+    # Remember the scammer's identifiers across sessions; returns the ones seen in another session before.
+    # Memory only - the database write happens on the store's writer thread.
+    with stage_timer("intel_record"):
+        if not session:
+            return intel_store.record(intelligence, str(uuid.uuid4()))
+        new_in_session = {key: [v for v in values if v not in session.intelligence.get(key, [])]
+                          for key, values in intelligence.items() if isinstance(values, list)}
+        return intel_store.record(intelligence, session.session_id, new_in_session)
+
+async def lookup_identifier(value, kind=None, history_limit=20):
+    # Seen before / how many sessions / when (memory), plus the sessions themselves (SQLite, on a thread).
+    # Raises ValueError for an unknown kind.
+    kind = kind or guess_kind(value)
+    result = intel_store.lookup(kind, value)
+    result["history"] = await asyncio.to_thread(intel_store.history, kind, value, history_limit)
+    return result
+
+def send_to_guvi(intelligence, notes, session=None):
     # FILTER: Don't report if we found absolutely nothing yet
     # We check if all the lists in intelligence are empty
-    has_data = any(intelligence.get(k) for k in ["bankAccounts", "upiIds", "phishingLinks", "phoneNumbers"])
-    
-    if not has_data:
+    if not has_identifiers(intelligence):
         # We skip reporting if no concrete data (links/phones) was found to avoid spamming empty reports
+        metrics.REPORTS.inc(outcome="no_identifiers")
         return 
+    if not GUVI_REPORT_URL:
+        # Reporting switched off (GUVI_REPORT_URL=""), e.g. for offline evaluation runs
+        metrics.REPORTS.inc(outcome="disabled")
+        return
 
     # Prepare the mandatory JSON payload
     payload = {
-        "sessionId": str(uuid.uuid4()),  # Generates a unique ID
+        # Real session if the client sent one, otherwise a one-off ID for this single exchange
+        "sessionId": session.session_id if session else str(uuid.uuid4()),
         "scamDetected": True,
-        "totalMessagesExchanged": 5,     # Mock value (since we are stateless)
-        "extractedIntelligence": intelligence,
+        "totalMessagesExchanged": session.message_count if session else 2,
+        "extractedIntelligence": {k: intelligence.get(k, []) for k in GUVI_KEYS},  # GUVI's schema only
         "agentNotes": notes or "Scam intent confirmed."
     }
     
-    try:
-        # Send POST request to GUVI
-        response = requests.post(url, json=payload)
-        print(f"REPORTING TO GUVI... Status: {response.status_code}")
-    except Exception as e:
-        print(f"Failed to send report to GUVI: {e}")
+    # Hand it to the background worker - never blocks the request
+    # (it POSTs to GUVI_REPORT_URL with timeouts, retries and de-duplication)
+    with stage_timer("report_enqueue"):
+        queued = guvi_reporter.submit(payload, dedupe_scope=session.session_id if session else None)
+    metrics.REPORTS.inc(outcome="queued" if queued else "duplicate")
+
+# Scrape-time views of the in-memory state, next to the request metrics on GET /metrics
+metrics.FunctionMetric("honeypot_verdict_cache_lookups_total", "Verdict cache lookups by result",
+                       lambda: {k: verdict_cache.stats()[k] for k in ("hits", "near_hits", "misses")},
+                       metric_type="counter", label="result")
+metrics.FunctionMetric("honeypot_verdict_cache_entries", "Verdicts currently cached",
+                       lambda: verdict_cache.stats()["size"])
+metrics.FunctionMetric("honeypot_intel_store_total", "Intelligence store sightings by outcome (and repeats flagged)",
+                       lambda: {k: v for k, v in intel_store.stats().items() if k not in ("indexed", "queued")},
+                       metric_type="counter", label="event")
+metrics.FunctionMetric("honeypot_intel_store_identifiers", "Identifiers in the intelligence store's memory index",
+                       lambda: intel_store.stats()["indexed"])
+metrics.FunctionMetric("honeypot_intel_store_queued", "Sightings waiting for the database writer",
+                       lambda: intel_store.stats()["queued"])
+metrics.FunctionMetric("honeypot_llm_cassette_total", "LLM cassette lookups and recordings (when LLM_CASSETTE is set)",
+                       lambda: {k: v for k, v in cassette.stats().items() if k != "entries"} if cassette else {},
+                       metric_type="counter", label="event")
+metrics.FunctionMetric("honeypot_feed_subscribers", "Dashboards connected to /feed", lambda: live_feed.stats()["subscribers"])
+metrics.FunctionMetric("honeypot_feed_events_total", "Live feed events published, dropped for slow dashboards, and dashboards cut off",
+                       lambda: {k: v for k, v in live_feed.stats().items() if k != "subscribers"},
+                       metric_type="counter", label="event")
+metrics.FunctionMetric("honeypot_sessions", "Conversations held in memory", lambda: session_store.stats()["sessions"])
+metrics.FunctionMetric("honeypot_session_bytes", "Estimated memory used by the session store",
+                       lambda: session_store.stats()["bytes"])
+metrics.FunctionMetric("honeypot_guvi_reporter", "GUVI reporter queue depth and delivery counts",
+                       guvi_reporter.stats, label="state")
+metrics.FunctionMetric("honeypot_local_classifier_total", "Local classifier outcomes (decided = Gatekeeper call avoided)",
+                       lambda: local_classifier.stats() if local_classifier else {}, metric_type="counter", label="outcome")
+metrics.FunctionMetric("honeypot_llm_calls_in_flight", "LLM calls currently holding a slot",
+                       lambda: llm_scheduler.in_flight)
+metrics.FunctionMetric("honeypot_llm_scheduler_total", "LLM scheduler events (retries, 429s, coalesced calls, breaker trips...)",
+                       lambda: {k: v for k, v in llm_scheduler.stats().items() if k not in ("in_flight", "waiting")},
+                       metric_type="counter", label="event")
+metrics.FunctionMetric("honeypot_llm_calls_waiting", "LLM calls queued for a slot or quota", lambda: len(llm_scheduler.waiting))
+metrics.FunctionMetric("honeypot_llm_quota_remaining", "Estimated Groq quota left (-1 = not known yet)",
+                       llm_scheduler.quota, label="quota")
+metrics.FunctionMetric("honeypot_llm_circuit_open", "1 while the LLM circuit breaker is open or half-open",
+                       lambda: int(llm_scheduler.breaker_state() != "closed"))
 
 # ==============================================================================
 # 5. MAIN LOGIC FUNCTION
 # ==============================================================================
-def process_message(user_text):
-    # 1. Ask Gatekeeper (The Brain)
-    gatekeeper = get_llm_response(GATEKEEPER_PROMPT, user_text)
+def verdict_from(item, model):
+    # A well-formed Gatekeeper verdict (tagged with the model that made it), or None
+    if not isinstance(item, dict):
+        return None
+    classification = str(item.get("classification", "")).upper()
+    if classification not in ("SAFE", "SCAM"):
+        return None
+    return {
+        "classification": classification,
+        "reason": item.get("reason", "No specific reason provided."),
+        "confidence": item.get("confidence"),
+        "model": model,
+    }
+
+def confident_enough(verdict):
+    try:
+        return float(verdict.get("confidence")) >= GATEKEEPER_ESCALATION_CONFIDENCE
+    except (TypeError, ValueError):
+        return False  # missing or garbled confidence counts as unsure
+
+async def ask_gatekeeper(user_text):
+    # Small model first (if routing is on), the big one when it is unsure or answers garbage
+    prompt = gatekeeper_prompt_for(user_text)
+    if GATEKEEPER_ROUTING:
+        verdict = verdict_from(
+            await get_llm_response_async(prompt, user_text, model=GATEKEEPER_SMALL_MODEL, stage="gatekeeper_small"),
+            GATEKEEPER_SMALL_MODEL)
+        if verdict and confident_enough(verdict):
+            return verdict
+        metrics.ESCALATIONS.inc(stage="gatekeeper", reason="low_confidence" if verdict else "malformed")
+    return verdict_from(
+        await get_llm_response_async(prompt, user_text, model=GATEKEEPER_MODEL, stage="gatekeeper"), GATEKEEPER_MODEL)
+
+def lookup_cached_verdict(user_text):
+    if not VERDICT_CACHE_SIZE:
+        return None
+    # Verdicts made under an older prompt are no longer trustworthy
+    current_version = gatekeeper_version()
+    if verdict_cache.prompt_version != current_version:
+        verdict_cache.invalidate(current_version)
+    with stage_timer("cache_lookup"):
+        return verdict_cache.get(user_text)
+
+def classify_locally(user_text):
+    if not local_classifier:
+        return None
+    with stage_timer("local_classifier"):
+        return local_classifier.classify(user_text)
+
+def remember_verdict(user_text, gatekeeper):
+    # A Gatekeeper verdict feeds the cache now and the local classifier's next retrain
+    if VERDICT_CACHE_SIZE:
+        verdict_cache.put(user_text, gatekeeper)
+    verdict_log.log(user_text, gatekeeper)
+
+def classify_from_cache_or_model(user_text):
+    # Copies of a known template skip the LLM, and so do messages the local classifier is confident about
+    cached = lookup_cached_verdict(user_text)
+    if cached:
+        return cached, "cache"
+    verdict = classify_locally(user_text)
+    if verdict:
+        return verdict, "model:local"
+    return None, None
+
+def degraded_verdict(user_text):
+    # The LLM is down or out of quota: best local guess. Never cached or logged.
+    metrics.DEGRADED.inc(kind="verdict")
+    if local_classifier:
+        p = local_classifier.probability(user_text)
+        scam, why = p >= 0.5, f"local classifier P(scam)={p:.2f}"
+    else:
+        intelligence = extract_intelligence(user_text)
+        keywords = intelligence["suspiciousKeywords"]
+        # Lean towards SCAM: a wasted reply costs less than a missed scammer
+        scam = len(keywords) >= 2 or (has_identifiers(intelligence) and bool(keywords))
+        why = f"keywords: {', '.join(keywords)}" if keywords else "no scam keywords"
+    return {
+        "classification": "SCAM" if scam else "SAFE",
+        "reason": f"Gatekeeper unavailable - degraded local verdict ({why}).",
+        "confidence": 50,
+    }
+
+DEGRADED_REPLIES = [
+    "hang on... finding my reading glasses...",
+    "sorry beta... my phone is very slow today... can you send it again?",
+    "wait wait... someone is at the door... which number should i call you on?",
+    "oh dear... the screen went white again... what is your upi id? i will ask my neighbour",
+]
+
+def degraded_reply():
+    # Mrs. Higgins is unavailable: stall in character so the scammer keeps talking
+    metrics.DEGRADED.inc(kind="reply")
+    return {"reply": random.choice(DEGRADED_REPLIES), "agentNotes": "LLM unavailable - stalling reply."}
+
+async def classify_with_llm(user_text):
+    gatekeeper = await ask_gatekeeper(user_text)
+    if gatekeeper:
+        remember_verdict(user_text, gatekeeper)
+    elif LLM_DEGRADED_FALLBACK:
+        return degraded_verdict(user_text), "degraded:local"
+    return gatekeeper, "llm:gatekeeper"
+
+async def classify_with_cache(user_text):
+    # Returns (gatekeeper verdict, decided_by)
+    gatekeeper, decided_by = classify_from_cache_or_model(user_text)
+    if gatekeeper:
+        return gatekeeper, decided_by
+    return await classify_with_llm(user_text)
+
+def open_session(session_id, user_text):
+    # Loads (or starts) the conversation and records the scammer's new message
+    if not session_id:
+        return None
+    session = session_store.get_or_create(session_id)
+    session_store.add_turn(session, "scammer", user_text)
+    return session
+
+async def classify_message(user_text, session=None):
+    gatekeeper, decided_by = classify_without_llm(user_text, session)
     if not gatekeeper:
-        return {"status": "error", "classification": "UNKNOWN"}
-    
-    classification = gatekeeper.get("classification", "SAFE").upper()
-    reason = gatekeeper.get("reason", "No specific reason provided.") # <--- ADDED: Capture the 'why'
+        gatekeeper, decided_by = await classify_with_llm(user_text)
+    announce_decision(user_text, gatekeeper, decided_by, session)
+    return gatekeeper, decided_by
 
-    # 2. THE SANITY CHECK: If Safe, Stop here
-    if classification == "SAFE":
-        return {
-            "status": "ignored",
-            "classification": "SAFE",
-            "reply": None,
-            "intelligence": None
-        }
-
-    # 3. If Scam, Wake up Mrs. Higgins with CONTEXT
+def check_rules_timed(user_text):
+    if not RULE_ENGINE_ENABLED:
+        return None
+    with stage_timer("rules"):
+        return check_rules(user_text)
+
+def classify_without_llm(user_text, session=None):
+    # (verdict, decided_by) from the session / rules / cache / local classifier, or (None, None)
+    # Once a conversation is confirmed as a scam, every later message is part of it
+    if session and session.scam_detected:
+        return {"classification": "SCAM", "reason": "Conversation already confirmed as a scam."}, "session"
+    # Hard rules first (microseconds). Only ask the Gatekeeper (The Brain) if none fired.
+    gatekeeper = check_rules_timed(user_text)
+    if gatekeeper:
+        return gatekeeper, f"rule:{gatekeeper['rule']}"
+    return classify_from_cache_or_model(user_text)
+
+def safe_result(local_intelligence, decided_by, model=None, session=None):
+    session_id = session.session_id if session else None
+    return {
+        "status": "ignored",
+        "classification": "SAFE",
+        "reply": None,
+        "intelligence": local_intelligence if has_identifiers(local_intelligence) else None,
+        # Not recorded (it isn't a scam), but worth knowing if a scammer's identifier shows up here
+        "repeat_identifiers": intel_store.find_repeats(local_intelligence, session_id) or None,
+        "decided_by": decided_by,
+        "model": model,
+        "sessionId": session_id
+    }
+
+def higgins_input_for(user_text, reason, session=None):
     # We pass the Gatekeeper's reasoning so she doesn't give a generic response
-    higgins_input = f"Scammer said: {user_text}. Gatekeeper Analysis: {reason}" 
-    higgins = get_llm_response(HIGGINS_PROMPT, higgins_input)
-    
-    if not higgins:
-        return {"status": "error", "classification": "SCAM"}
-    
-    # Extract data
-    intelligence = higgins.get("extracted_intelligence", {})
+    higgins_input = f"Scammer said: {user_text}. Gatekeeper Analysis: {reason}"
+    # ...and the conversation so far, trimmed to a fixed token budget
+    history = session_store.history_for_prompt(session) if session else ""
+    if history:
+        higgins_input = f"Conversation so far:\n{history}\n\n{higgins_input}"
+    return higgins_input
+
+def finish_engagement(user_text, higgins, local_intelligence, decided_by, session=None, model=None):
+    # Extract data (local extraction + whatever she found that really is in the message)
+    if HIGGINS_LLM_EXTRACTION:
+        intelligence = merge_intelligence(local_intelligence, higgins.get("extracted_intelligence"), user_text)
+    else:
+        intelligence = local_intelligence
     notes = higgins.get("agentNotes", "")
+    repeats = record_sightings(intelligence, session)
+
+    if session:
+        session.scam_detected = True
+        session_store.add_turn(session, "agent", higgins.get("reply") or "")
+        session_store.record_intelligence(session, intelligence)
     
-    # 4. REPORT TO GUVI 
+    # REPORT TO GUVI 
     # Automatically send the intelligence to the backend evaluation system
-    send_to_guvi(intelligence, notes)
+    # (with a session, GUVI gets everything gathered in the whole conversation)
+    send_to_guvi(session.intelligence if session else intelligence, notes, session)
     
     return {
         "status": "engaged",
         "classification": "SCAM",
         "reply": higgins.get("reply"),
-        "intelligence": intelligence
-    }
\ No newline at end of file
+        "intelligence": intelligence,
+        "repeat_identifiers": repeats or None,  # identifiers already seen in other sessions
+        "decided_by": decided_by,
+        "model": model,  # the model that classified it (None for rules / session)
+        "sessionId": session.session_id if session else None
+    }
+
+async def engage_scammer(user_text, reason, local_intelligence, decided_by, session=None, model=None):
+    # Wake up Mrs. Higgins with CONTEXT
+    higgins = await get_llm_response_async(HIGGINS_PROMPT, higgins_input_for(user_text, reason, session),
+                                           model=HIGGINS_MODEL, stage="higgins")
+    if not higgins and LLM_DEGRADED_FALLBACK:
+        higgins = degraded_reply()
+    
+    if not higgins:
+        return {"status": "error", "classification": "SCAM"}
+    
+    return finish_engagement(user_text, higgins, local_intelligence, decided_by, session, model)
+
+def count_wasted_reply(mode, outcome, prompt, user_input, reply=None):
+    # A Mrs. Higgins reply (or the prompt for one) that a SAFE verdict made useless
+    metrics.SPECULATION.inc(mode=mode, outcome=outcome)
+    wasted = estimate_tokens(prompt) + estimate_tokens(user_input)
+    if reply:
+        wasted += estimate_tokens(json.dumps(reply))
+    metrics.WASTED_TOKENS.inc(wasted, mode=mode)
+
+async def classify_and_engage_speculatively(user_text, local_intelligence, session=None):
+    # Gatekeeper and Mrs. Higgins at the same time: SCAM replies arrive after max(both) instead of their sum
+    higgins_input = higgins_input_for(user_text, SPECULATIVE_REASON, session)
+    higgins_task = asyncio.ensure_future(
+        get_llm_response_async(HIGGINS_PROMPT, higgins_input, model=HIGGINS_MODEL, stage="higgins_speculative")
+    )
+    try:
+        gatekeeper, decided_by = await classify_with_llm(user_text)
+    except BaseException:
+        higgins_task.cancel()
+        raise
+    announce_decision(user_text, gatekeeper, decided_by, session)
+
+    if not gatekeeper or gatekeeper["classification"] == "SAFE":
+        if higgins_task.done():
+            count_wasted_reply("speculative", "discarded", HIGGINS_PROMPT, higgins_input, higgins_task.result())
+        else:
+            higgins_task.cancel()  # frees the LLM slot; Groq may still bill the prompt
+            count_wasted_reply("speculative", "cancelled", HIGGINS_PROMPT, higgins_input)
+        if not gatekeeper:
+            return {"status": "error", "classification": "UNKNOWN"}
+        return safe_result(local_intelligence, decided_by, gatekeeper.get("model"), session)
+
+    metrics.SPECULATION.inc(mode="speculative", outcome="used")
+    higgins = await higgins_task
+    if not higgins and LLM_DEGRADED_FALLBACK:
+        higgins = degraded_reply()
+    if not higgins:
+        return {"status": "error", "classification": "SCAM"}
+    return finish_engagement(user_text, higgins, local_intelligence, decided_by, session, gatekeeper.get("model"))
+
+async def classify_and_engage_in_one_call(user_text, local_intelligence, session=None):
+    # One LLM call decides SAFE/SCAM and writes the reply. SAFE messages pay for the longer prompt.
+    history = session_store.history_for_prompt(session) if session else ""
+    user_input = f"Conversation so far:\n{history}\n\nNew message: {user_text}" if history else user_text
+    prompt = single_call_prompt_for(user_text)
+    response = await get_llm_response_async(prompt, user_input, model=HIGGINS_MODEL, stage="single_call")
+    gatekeeper = verdict_from(response, HIGGINS_MODEL)
+    decided_by = "llm:single-call"
+    if gatekeeper:
+        remember_verdict(user_text, gatekeeper)
+    elif LLM_DEGRADED_FALLBACK:
+        gatekeeper, decided_by = degraded_verdict(user_text), "degraded:local"
+        response = degraded_reply() if gatekeeper["classification"] == "SCAM" else {}
+    announce_decision(user_text, gatekeeper, decided_by, session)
+    if not gatekeeper:
+        return {"status": "error", "classification": "UNKNOWN"}
+
+    model = gatekeeper.get("model")
+    if gatekeeper["classification"] == "SAFE":
+        if model:
+            count_wasted_reply("single_call", "discarded", SINGLE_CALL_TASK + HIGGINS_PERSONA, "")
+        return safe_result(local_intelligence, decided_by, model, session)
+
+    if model:
+        metrics.SPECULATION.inc(mode="single_call", outcome="used")
+    if not response.get("reply") and LLM_DEGRADED_FALLBACK:
+        response = degraded_reply()
+    if not response.get("reply"):
+        return {"status": "error", "classification": "SCAM"}
+    return finish_engagement(user_text, response, local_intelligence, decided_by, session, model)
+
+def extract_timed(user_text):
+    with stage_timer("extract"):
+        return extract_intelligence(user_text)
+
+async def process_message_async(user_text, session_id=None):
+    # Timed end to end; the per-stage breakdown goes to /metrics (and the log with TIMING_LOGS=1)
+    with metrics.track_request("chat") as request:
+        result = await handle_message(user_text, session_id)
+        announce_result(user_text, result, session_id)
+        request["path"] = result.get("classification") if result.get("status") != "error" else "error"
+        request["decided_by"] = result.get("decided_by")
+        return result
+
+async def handle_message(user_text, session_id=None):
+    # 0. Local identifier extraction - runs on every message, takes well under a millisecond
+    local_intelligence = extract_timed(user_text)
+    session = open_session(session_id, user_text)
+
+    # 1. Ask the session / rules / cache / local classifier, then the Gatekeeper
+    gatekeeper, decided_by = classify_without_llm(user_text, session)
+    if not gatekeeper and PIPELINE_MODE == "speculative":
+        return await classify_and_engage_speculatively(user_text, local_intelligence, session)
+    if not gatekeeper and PIPELINE_MODE == "single_call":
+        return await classify_and_engage_in_one_call(user_text, local_intelligence, session)
+    if not gatekeeper:
+        gatekeeper, decided_by = await classify_with_llm(user_text)
+    announce_decision(user_text, gatekeeper, decided_by, session)
+    if not gatekeeper:
+        return {"status": "error", "classification": "UNKNOWN"}
+    
+    classification = gatekeeper.get("classification", "SAFE").upper()
+    reason = gatekeeper.get("reason", "No specific reason provided.") # <--- ADDED: Capture the 'why'
+
+    # 2. THE SANITY CHECK: If Safe, Stop here
+    if classification == "SAFE":
+        return safe_result(local_intelligence, decided_by, gatekeeper.get("model"), session)
+
+    # 3. If Scam, Mrs. Higgins takes over (and reports to GUVI)
+    return await engage_scammer(user_text, reason, local_intelligence, decided_by, session, gatekeeper.get("model"))
+
+def process_message(user_text, session_id=None):
+    # Blocking wrapper for scripts / the command line.
+    # Do NOT call this from inside a running event loop - await process_message_async instead.
+    return asyncio.run(process_message_async(user_text, session_id))
+
+# ==============================================================================
+# 6. BATCH MODE (MANY MESSAGES, ONE GATEKEEPER CALL)
+# ==============================================================================
+def pack_batches(indexed_messages, token_budget=BATCH_TOKEN_BUDGET, max_size=BATCH_MAX_MESSAGES):
+    # Greedy packing of [(index, text)] into chunks that fit the token budget
+    batches, current, used = [], [], 0
+    for index, text in indexed_messages:
+        cost = estimate_tokens(text) + 8  # + the {"index": n, "message": ...} wrapper
+        if current and (used + cost > token_budget or len(current) >= max_size):
+            batches.append(current)
+            current, used = [], 0
+        current.append((index, text))
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+async def ask_gatekeeper_batch(batch, model, stage):
+    # One Gatekeeper call for the whole chunk. Returns {index: verdict} for the well-formed answers
+    payload = json.dumps([{"index": index, "message": text} for index, text in batch], ensure_ascii=False)
+    response = await get_llm_response_async(gatekeeper_batch_prompt_for([text for _, text in batch]), payload,
+                                            model=model, stage=stage)
+    indices = dict(batch)
+    verdicts = {}
+    for item in (response or {}).get("results") or []:
+        verdict = verdict_from(item, model)
+        if verdict and item.get("index") in indices:
+            verdicts[item["index"]] = verdict
+    return verdicts
+
+async def classify_batch(batch):
+    # Returns {index: (verdict, decided_by)} for every message in the chunk
+    if GATEKEEPER_ROUTING:
+        verdicts = await ask_gatekeeper_batch(batch, GATEKEEPER_SMALL_MODEL, "gatekeeper_batch_small")
+        verdicts = {index: v for index, v in verdicts.items() if confident_enough(v)}
+        unsure = [(index, text) for index, text in batch if index not in verdicts]
+        if unsure:
+            metrics.ESCALATIONS.inc(len(unsure), stage="gatekeeper_batch", reason="low_confidence_or_missing")
+            verdicts.update(await ask_gatekeeper_batch(unsure, GATEKEEPER_MODEL, "gatekeeper_batch"))
+    else:
+        verdicts = await ask_gatekeeper_batch(batch, GATEKEEPER_MODEL, "gatekeeper_batch")
+    verdicts = {index: (verdict, "llm:gatekeeper-batch") for index, verdict in verdicts.items()}
+
+    missing = []
+    for index, text in batch:
+        if index in verdicts:
+            remember_verdict(text, verdicts[index][0])
+        else:
+            missing.append((index, text))
+    if missing:
+        # The model skipped / garbled these - ask about each on its own, all at once
+        # (the scheduler runs them as far as the concurrency cap and quota allow)
+        answers = await asyncio.gather(*(classify_with_cache(text) for _, text in missing))
+        verdicts.update(zip((index for index, _ in missing), answers))
+    return verdicts
+
+async def process_batch_async(messages):
+    """
+    Async generator of NDJSON-ready events for a list of messages.
+    Rules and the cache go first; what's left is packed into as few Gatekeeper calls as
+    the token budget allows, and only the SCAM subset wakes up Mrs. Higgins.
+    Every message gets a "classification" event, then a "result" event.
+    """
+    with metrics.track_request("chat_batch") as request:
+        request["messages"] = len(messages)
+        async for event in batch_events(messages):
+            if event["stage"] == "result":
+                announce_result(messages[event["index"]], event, index=event["index"])
+            yield event
+        request["path"] = "batch"
+
+async def batch_events(messages):
+    local = [extract_timed(text) for text in messages]
+    remaining = []
+    running = set()
+
+    async def already_decided(verdicts):
+        return verdicts
+
+    # 1. Rules + cache + local classifier (no LLM). Anything they decide is emitted straight away.
+    known = {}
+    for index, text in enumerate(messages):
+        verdict = check_rules_timed(text)
+        if verdict:
+            known[index] = (verdict, f"rule:{verdict['rule']}")
+            continue
+        cached = lookup_cached_verdict(text)
+        if cached:
+            known[index] = (cached, "cache")
+            continue
+        verdict = classify_locally(text)
+        if verdict:
+            known[index] = (verdict, "model:local")
+        else:
+            remaining.append((index, text))
+    if known:
+        running.add(asyncio.ensure_future(already_decided(known)))
+
+    # 2. One Gatekeeper call per packed chunk, all chunks in parallel
+    batches = pack_batches(remaining)
+    for batch in batches:
+        running.add(asyncio.ensure_future(classify_batch(batch)))
+    engagements = {}
+
+    try:
+        while running:
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                outcome = task.result()
+                if task in engagements:
+                    # 4. Mrs. Higgins finished with this one
+                    yield {"stage": "result", "index": engagements.pop(task), **outcome}
+                    continue
+
+                # 3. A classification stage finished
+                for index, (verdict, decided_by) in sorted(outcome.items()):
+                    announce_decision(messages[index], verdict, decided_by, index=index)
+                    if not verdict:
+                        yield {"stage": "result", "index": index, "status": "error", "classification": "UNKNOWN"}
+                        continue
+                    classification = verdict.get("classification", "SAFE").upper()
+                    yield {
+                        "stage": "classification",
+                        "index": index,
+                        "classification": classification,
+                        "reason": verdict.get("reason"),
+                        "decided_by": decided_by,
+                        "model": verdict.get("model"),
+                    }
+                    if classification == "SAFE":
+                        yield {"stage": "result", "index": index, **safe_result(local[index], decided_by, verdict.get("model"))}
+                    else:
+                        reason = verdict.get("reason", "No specific reason provided.")
+                        engagement = asyncio.ensure_future(
+                            engage_scammer(messages[index], reason, local[index], decided_by, model=verdict.get("model"))
+                        )
+                        engagements[engagement] = index
+                        running.add(engagement)
+    finally:
+        # Client went away mid-stream - don't leave LLM calls running for nobody
+        for task in running:
+            task.cancel()
+
+    yield {"stage": "done", "count": len(messages), "gatekeeper_batches": len(batches)}
+
+# ==============================================================================
+# 7. STREAMING MODE (SERVER-SENT EVENTS FOR THE UI)
+# ==============================================================================
+async def process_message_stream(user_text, session_id=None):
+    """
+    Async generator of (event, data) pairs for /chat/stream:
+    "classification" as soon as the Gatekeeper decides, "token" for each piece of
+    Mrs. Higgins' reply as Groq produces it, then "result" (intelligence etc.) last.
+    """
+    with metrics.track_request("chat_stream") as request:
+        async for event, data in stream_events(user_text, session_id):
+            if event == "result":
+                announce_result(user_text, data, session_id)
+                request["path"] = data.get("classification") if data.get("status") != "error" else "error"
+                request["decided_by"] = data.get("decided_by")
+            yield event, data
+
+async def stream_events(user_text, session_id=None):
+    local_intelligence = extract_timed(user_text)
+    session = open_session(session_id, user_text)
+
+    gatekeeper, decided_by = await classify_message(user_text, session)
+    if not gatekeeper:
+        yield "result", {"status": "error", "classification": "UNKNOWN"}
+        return
+
+    classification = gatekeeper.get("classification", "SAFE").upper()
+    reason = gatekeeper.get("reason", "No specific reason provided.")
+    model = gatekeeper.get("model")
+    yield "classification", {"classification": classification, "reason": reason, "decided_by": decided_by, "model": model}
+
+    if classification == "SAFE":
+        yield "result", safe_result(local_intelligence, decided_by, model, session)
+        return
+
+    parser = ReplyStreamParser()
+    try:
+        async for chunk in stream_llm_response_async(HIGGINS_PROMPT, higgins_input_for(user_text, reason, session),
+                                                   model=HIGGINS_MODEL, stage="higgins"):
+            text = parser.feed(chunk)
+            if text:
+                yield "token", {"text": text}
+    except Exception as e:
+        print(f"LLM Error: {e}")
+        if parser.buffer or not LLM_DEGRADED_FALLBACK:
+            yield "result", {"status": "error", "classification": "SCAM"}
+            return
+        # Failed before the first token: stall in character instead
+        higgins = degraded_reply()
+        yield "token", {"text": higgins["reply"]}
+    else:
+        higgins = parse_llm_json(parser.buffer, "higgins")
+    if not higgins:
+        yield "result", {"status": "error", "classification": "SCAM"}
+        return
+
+    yield "result", finish_engagement(user_text, higgins, local_intelligence, decided_by, session, model)
@@ -0,0 +1,75 @@
+import time
+import queue
+import atexit
+import threading
+
+# ==============================================================================
+# BACKGROUND WRITER (DISK WRITES OFF THE REQUEST PATH)
+# ==============================================================================
+# The request path hands records to put() and moves on. One daemon thread
+# collects whatever has queued up and passes it to write() in a single call, so
+# the event loop never waits on the disk and the disk sees few, large writes.
+# Used by the intelligence store (SQLite), the Gatekeeper verdict log and the
+# GUVI reporter's spill file.
+
+
+class BackgroundWriter:
+    def __init__(self, write, name, queue_size=10000, batch_size=500, flush_interval=0.0):
+        """
+        write(records) runs on the writer thread with up to batch_size records, waiting at most
+        flush_interval seconds for a batch to fill (0 = take what is already queued).
+        """
+        self.write = write
+        self.name = name
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.thread = None
+        self.lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def put(self, records):
+        """Queues a list of records. Returns False (without blocking) if the queue is full."""
+        try:
+            self.queue.put_nowait(records)
+        except queue.Full:
+            return False
+        self._ensure_thread()
+        return True
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def _ensure_thread(self):
+        if self.thread and self.thread.is_alive():
+            return
+        with self.lock:
+            if not (self.thread and self.thread.is_alive()):
+                self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            records = list(self.queue.get())
+            # Whatever else arrives within flush_interval goes into the same write
+            deadline = time.monotonic() + self.flush_interval
+            batches = 1
+            while len(records) < self.batch_size:
+                try:
+                    records.extend(self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                                   if self.flush_interval else self.queue.get_nowait())
+                    batches += 1
+                except queue.Empty:
+                    break
+            try:
+                self.write(records)
+            except Exception as e:
+                print(f"{self.name}: write failed: {e}")
+            for _ in range(batches):
+                self.queue.task_done()
+
+    def flush(self, timeout=5.0):
+        """Waits (up to timeout) for queued records to be written (runs at interpreter exit)."""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline and self.thread and self.thread.is_alive():
+            time.sleep(0.01)
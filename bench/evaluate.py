@@ -0,0 +1,265 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from contextlib import redirect_stdout
+
+from bench.loadgen import ROOT, percentile, git_commit
+
+# ==============================================================================
+# OFFLINE EVALUATION (ACCURACY VS COST) ON A LABELLED CORPUS
+# ==============================================================================
+# Runs every message of a labelled corpus through agent.process_message_async
+# (several at a time) with the LLM answers replayed from a cassette (cassette.py),
+# and prints a JSON report: precision / recall per class, extraction recall per
+# identifier type, LLM calls and tokens per message, simulated latency and which
+# stage decided. No network and no API key are needed, so prompt edits and modes
+# (fast paths, verdict cache, routing, pipeline modes) can be compared in seconds:
+#
+#   python -m bench.evaluate --record                     # once, against Groq: fills the cassette
+#   python -m bench.evaluate                              # offline replay
+#   python -m bench.evaluate --set GATEKEEPER_ROUTING=1 --set PIPELINE_MODE=single_call --record
+#
+# --record replays what's on the cassette and records only the calls that aren't
+# (a changed prompt or a new mode), so run it after every prompt edit. Plain replay
+# fails those calls: they count as LLM errors (scored ERROR, not as a degraded local
+# guess), show up under "cassette.misses", and the command exits with status 1.
+# The verdict cache makes results depend on the order messages finish in; use
+# --concurrency 1 (or --set VERDICT_CACHE_SIZE=0) when you need identical runs.
+#
+# Corpus lines: {"text": ..., "label": "SCAM" | "SAFE", "intelligence": {"upiIds": [...], ...}}
+
+DEFAULT_CORPUS = os.path.join(ROOT, "data", "eval_corpus.jsonl")
+DEFAULT_CASSETTE = os.path.join(ROOT, "data", "cassettes", "eval.jsonl")
+LABELS = ("SCAM", "SAFE")
+
+
+def ratio(part, whole):
+    return round(part / whole, 3) if whole else None
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# --- SCORING ---
+def predicted_label(result):
+    if result.get("status") == "error":
+        return "ERROR"
+    return result.get("classification") or "ERROR"
+
+
+def classification_report(samples):
+    confusion = {label: {} for label in LABELS}
+    for sample in samples:
+        row = confusion.setdefault(sample["label"], {})
+        row[sample["predicted"]] = row.get(sample["predicted"], 0) + 1
+
+    report = {}
+    for label in LABELS:
+        true_positive = confusion.get(label, {}).get(label, 0)
+        predicted = sum(row.get(label, 0) for row in confusion.values())
+        support = sum(confusion.get(label, {}).values())
+        precision, recall = ratio(true_positive, predicted), ratio(true_positive, support)
+        f1 = round(2 * precision * recall / (precision + recall), 3) if precision and recall else 0.0
+        report[label] = {"precision": precision, "recall": recall, "f1": f1, "support": support}
+    report["accuracy"] = ratio(sum(1 for s in samples if s["predicted"] == s["label"]), len(samples))
+    report["confusion"] = confusion  # label -> predicted -> count
+    return report
+
+
+def normalized(key, values):
+    from extractor import NORMALIZERS
+    return {v for v in (NORMALIZERS[key](str(raw)) for raw in values or []) if v}
+
+
+def extraction_misses(expected, found):
+    # Per identifier type: (expected values not found, values found that weren't expected)
+    from extractor import IDENTIFIER_KEYS
+    result = {}
+    for key in IDENTIFIER_KEYS:
+        want, got = normalized(key, expected.get(key)), normalized(key, (found or {}).get(key))
+        result[key] = (sorted(want - got), sorted(got - want), len(want))
+    return result
+
+
+def extraction_report(samples):
+    from extractor import IDENTIFIER_KEYS
+    report = {}
+    for key in IDENTIFIER_KEYS:
+        expected = sum(s["extraction"][key][2] for s in samples)
+        missed = sum(len(s["extraction"][key][0]) for s in samples)
+        report[key] = {
+            "expected": expected,
+            "found": expected - missed,
+            "recall": ratio(expected - missed, expected),
+            "unexpected": sum(len(s["extraction"][key][1]) for s in samples),
+        }
+    return report
+
+
+def cost_report(samples):
+    calls = [call for s in samples for call in s["calls"]]
+    by_stage = {}
+    for call in calls:
+        stage = by_stage.setdefault(call["stage"], {"calls": 0, "tokens": 0})
+        stage["calls"] += 1
+        stage["tokens"] += call["tokens"]
+    tokens = sum(call["tokens"] for call in calls)
+    return {
+        "llm_calls_per_message": ratio(len(calls), len(samples)),
+        "tokens_per_message": ratio(tokens, len(samples)),
+        "tokens_total": tokens,
+        "by_stage": dict(sorted(by_stage.items())),
+        "live_calls": sum(1 for call in calls if call["source"] == "live"),
+    }
+
+
+def latency_report(samples, latency_scale):
+    # Replayed calls wait latency_scale x their recorded latency, so dividing gives the recorded-speed
+    # estimate (exact at scale 1; the local stages are tiny next to the LLM either way)
+    if latency_scale <= 0:
+        return {"note": "latency_scale 0 - no latency simulated"}
+    latencies = [s["seconds"] / latency_scale for s in samples]
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1),
+    }
+
+
+def count_by(samples, key):
+    counts = {}
+    for sample in samples:
+        name = (sample[key] or "none").split(":")[0]
+        counts[name] = counts.get(name, 0) + 1
+    return dict(sorted(counts.items()))
+
+
+def mistakes(samples, limit):
+    found = []
+    for sample in samples:
+        missed = {key: values for key, (values, _, _) in sample["extraction"].items() if values}
+        if sample["predicted"] != sample["label"] or missed:
+            found.append({
+                "text": sample["text"][:100],
+                "label": sample["label"],
+                "predicted": sample["predicted"],
+                "decided_by": sample["decided_by"],
+                "missed_identifiers": missed or None,
+            })
+    return found[:limit]
+
+
+# --- THE RUN ---
+async def run(agent, corpus, concurrency):
+    from cassette import capture
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def evaluate(item):
+        async with semaphore:
+            with capture() as calls:
+                started = time.perf_counter()
+                result = await agent.process_message_async(item["text"])
+                seconds = time.perf_counter() - started
+        return {
+            "text": item["text"],
+            "label": item["label"].upper(),
+            "predicted": predicted_label(result),
+            "decided_by": result.get("decided_by"),
+            "extraction": extraction_misses(item.get("intelligence") or {}, result.get("intelligence")),
+            "calls": calls,
+            "seconds": seconds,
+        }
+
+    started = time.perf_counter()
+    samples = await asyncio.gather(*(evaluate(item) for item in corpus))
+    return samples, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score the pipeline on a labelled corpus with replayed LLM answers")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSONL with text / label / intelligence per line")
+    parser.add_argument("--cassette", default=DEFAULT_CASSETTE)
+    parser.add_argument("--record", action="store_true", help="Call Groq for anything not on the cassette and record it")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="Config for this run, e.g. --set PIPELINE_MODE=speculative (repeatable)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="Replayed calls wait this x their recorded latency (0 = no waiting)")
+    parser.add_argument("--prune", action="store_true", help="Drop cassette entries this run didn't use")
+    parser.add_argument("--mistakes", type=int, default=20, help="How many misclassified / missed messages to list")
+    parser.add_argument("--out", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    if not args.record and not os.path.exists(args.cassette):
+        parser.error(f"no cassette at {args.cassette} - run once with --record first")
+
+    settings = {}
+    for setting in args.set:
+        key, sep, value = setting.partition("=")
+        if not sep:
+            parser.error(f"--set expects KEY=VALUE, got {setting!r}")
+        settings[key] = value
+    os.environ.update({
+        # Nothing leaves the machine or lands in the working data files
+        "GUVI_REPORT_URL": "",
+        "GATEKEEPER_VERDICT_LOG": "",
+        "INTEL_STORE_PATH": "",
+        "GROQ_WARMUP": "0",
+        # A failed LLM call is an ERROR in the report, not a keyword guess scored as the model's answer
+        "LLM_DEGRADED_FALLBACK": "0",
+        **settings,
+        "LLM_CASSETTE": args.cassette,
+        "LLM_CASSETTE_MODE": "auto" if args.record else "replay",
+        "LLM_CASSETTE_LATENCY_SCALE": str(args.latency_scale),
+    })
+    if not args.record:
+        os.environ.setdefault("GROQ_API_KEY", "replay-only")  # never used: a miss fails before any request
+
+    corpus = load_corpus(args.corpus)
+    sys.path.insert(0, ROOT)
+    with redirect_stdout(sys.stderr):  # the pipeline's own logging; stdout is the report
+        import agent  # imported after the env is set, so the cassette and settings apply
+        samples, wall = asyncio.run(run(agent, corpus, args.concurrency))
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "corpus": os.path.relpath(args.corpus, ROOT),
+            "cassette": os.path.relpath(args.cassette, ROOT),
+            "mode": agent.cassette.mode,
+            "concurrency": args.concurrency,
+            "latency_scale": args.latency_scale,
+            "settings": settings,
+        },
+        "messages": len(samples),
+        "wall_seconds": round(wall, 2),
+        "classification": classification_report(samples),
+        "extraction": extraction_report(samples),
+        "cost": cost_report(samples),
+        "latency": latency_report(samples, args.latency_scale),
+        "decided_by": count_by(samples, "decided_by"),
+        "cassette": agent.cassette.stats(),
+        "mistakes": mistakes(samples, args.mistakes),
+    }
+    if args.prune:
+        report["cassette"]["pruned"] = agent.cassette.prune()
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if agent.cassette.mode == "replay" and agent.cassette.misses:
+        # Non-zero exit, so a CI job can't report a score from an incomplete cassette
+        sys.exit(f"{agent.cassette.misses} LLM calls were not on the cassette - rerun with --record")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from contextlib import redirect_stdout
+
+import httpx
+
+# ==============================================================================
+# LOAD GENERATOR FOR THE /chat PIPELINE
+# ==============================================================================
+# Drives main.app at a fixed concurrency and prints a JSON report (p50/p95/p99,
+# requests/sec, SAFE vs SCAM path, which stage decided) so runs can be compared
+# across commits. By default it starts the local mocks (bench.mock_groq and
+# bench.mock_guvi) and runs the app in-process, so no network or API key is needed:
+#
+#   python -m bench.loadgen --requests 500 --concurrency 50 --out bench_result.json
+#
+# Use --url to hit an already running server instead (then start the mocks yourself
+# and point GROQ_BASE_URL / GUVI_REPORT_URL of that server at them).
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CORPUS = os.path.join(ROOT, "data", "gatekeeper_examples.jsonl")
+NAMES = ["Ramesh", "Sunita", "Arjun", "Priya", "Mohan", "Kavita", "Vikram", "Anjali"]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def summarize(samples, wall_seconds=None):
+    latencies = [s["latency"] for s in samples]
+    summary = {
+        "count": len(samples),
+        "errors": sum(1 for s in samples if s["error"]),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+    }
+    if wall_seconds:
+        summary["rps"] = round(len(samples) / wall_seconds, 2)
+    return summary
+
+
+def group_by(samples, key):
+    groups = {}
+    for sample in samples:
+        groups.setdefault(sample[key] or "none", []).append(sample)
+    return {name: summarize(group) for name, group in sorted(groups.items())}
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["text"] for line in f if line.strip()]
+
+
+def vary(text, rng):
+    # Same template, different name/amount - what a real scam blast looks like
+    return f"{rng.choice(NAMES)}, {text} Ref {rng.randint(1000, 99999)}"
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+# --- MOCK SERVERS ---
+def start_mock(module, port, extra_args):
+    # The mock's logs go to stderr, so stdout stays a clean JSON report
+    process = subprocess.Popen([sys.executable, "-m", module, "--port", str(port), *extra_args], cwd=ROOT, stdout=sys.stderr)
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/stats", timeout=0.5)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"{module} did not start on port {port}")
+
+
+async def mock_stats(port):
+    async with httpx.AsyncClient() as client:
+        return (await client.get(f"http://127.0.0.1:{port}/stats")).json()
+
+
+# --- THE RUN ---
+async def run(client, messages, total, concurrency, api_key, endpoint):
+    samples = []
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            message = messages[i % len(messages)]
+            started = time.perf_counter()
+            error, data = None, {}
+            try:
+                response = await client.post(endpoint, json={"message": message}, headers={"x-api-key": api_key})
+                data = response.json()
+                if response.status_code != 200 or data.get("status") == "error":
+                    error = f"HTTP {response.status_code} / {data.get('status')}"
+            except Exception as e:
+                error = repr(e)
+            decided_by = data.get("decided_by") or ""
+            samples.append({
+                "latency": time.perf_counter() - started,
+                "error": error,
+                "path": data.get("classification") or "ERROR",
+                "decided_by": decided_by.split(":")[0] if decided_by else None,
+            })
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - started
+
+
+async def main_async(args):
+    rng = random.Random(args.seed)
+    corpus = load_corpus(args.corpus)
+    messages = [vary(rng.choice(corpus), rng) if args.vary else corpus[i % len(corpus)] for i in range(max(args.requests, len(corpus)))]
+    rng.shuffle(messages)
+
+    mocks = []
+    if not args.no_mocks:
+        mocks.append(start_mock("bench.mock_groq", args.groq_port, [
+            "--latency-ms", str(args.llm_latency_ms), "--jitter-ms", str(args.llm_jitter_ms),
+            "--rate-limit", str(args.rate_limit), "--seed", str(args.seed),
+        ]))
+        mocks.append(start_mock("bench.mock_guvi", args.guvi_port, ["--latency-ms", str(args.guvi_latency_ms)]))
+        os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{args.groq_port}"
+        os.environ["GUVI_REPORT_URL"] = f"http://127.0.0.1:{args.guvi_port}/api/updateHoneyPotFinalResult"
+        os.environ.setdefault("GROQ_API_KEY", "mock-key")
+
+    try:
+        if args.url:
+            client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+            api_key = args.api_key
+        else:
+            # Mock verdicts and identifiers must not end up in the training log / intelligence.db
+            os.environ.update(GATEKEEPER_VERDICT_LOG="", INTEL_STORE_PATH="")
+            sys.path.insert(0, ROOT)
+            import main  # imported after the env is set, so the Groq client points at the mock
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=args.timeout)
+            api_key = main.SECRET_API_KEY
+
+        async with client:
+            if args.warmup:
+                await run(client, messages, args.warmup, min(args.concurrency, args.warmup), api_key, args.endpoint)
+            samples, wall = await run(client, messages, args.requests, args.concurrency, api_key, args.endpoint)
+
+        report = {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": {k: v for k, v in vars(args).items() if k not in ("api_key", "out")},
+            "overall": summarize(samples, wall),
+            "by_path": group_by(samples, "path"),
+            "by_decided_by": group_by(samples, "decided_by"),
+        }
+        if not args.no_mocks:
+            await asyncio.sleep(args.drain_seconds)  # let the background reporter catch up
+            report["llm_stages"] = await mock_stats(args.groq_port)
+            report["guvi"] = await mock_stats(args.guvi_port)
+        return report
+    finally:
+        for process in mocks:
+            process.terminate()
+            process.wait(timeout=5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the /chat pipeline and print a JSON report")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=0, help="Requests to send (and ignore) before measuring")
+    parser.add_argument("--endpoint", default="/chat")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSONL file with a \"text\" field per line")
+    parser.add_argument("--vary", action="store_true", help="Randomize names/amounts like a real scam blast")
+    parser.add_argument("--url", help="Benchmark a running server instead of main.app in-process")
+    parser.add_argument("--api-key", default=os.environ.get("APP_PASSWORD", "local-dev-key"))
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--no-mocks", action="store_true", help="Don't start the mock Groq / GUVI servers")
+    parser.add_argument("--groq-port", type=int, default=9101)
+    parser.add_argument("--guvi-port", type=int, default=9102)
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Fraction of mock LLM calls answered with 429")
+    parser.add_argument("--guvi-latency-ms", type=float, default=50)
+    parser.add_argument("--drain-seconds", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    with redirect_stdout(sys.stderr):  # the app's own logging (GUVI reports, errors); stdout is the report
+        report = asyncio.run(main_async(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import deque
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from bench.loadgen import percentile
+
+# ==============================================================================
+# MOCK GROQ (OPENAI-COMPATIBLE) SERVER FOR BENCHMARKS
+# ==============================================================================
+# Answers POST /openai/v1/chat/completions the way Groq does (JSON or SSE stream,
+# `usage`, x-ratelimit-* headers), with configurable latency, jitter and 429s.
+# Point the app at it with GROQ_BASE_URL=http://127.0.0.1:<port>.
+#
+#   python -m bench.mock_groq --port 9101 --latency-ms 350 --jitter-ms 120 --rate-limit 0.02
+#
+# Small models (*8b*, *instant*) answer --small-speedup times faster and are counted as
+# e.g. "gatekeeper:small" in the stats.
+# GET /openai/v1/models answers the app's warm-up call.
+# GET /stats returns per-call-type counts and latencies (gatekeeper / batch / higgins / single_call);
+# POST /reset clears them.
+
+SCAM_WORDS = ("otp", "kyc", "blocked", "bit.ly", "lottery", "prize", "disconnected", "suspended",
+              "refund", "mistake", "pay", "upi", "verify", "urgent", "click", "apk", "exe")
+
+
+def verdict_for(text):
+    hits = [w for w in SCAM_WORDS if w in text.lower()]
+    if hits:
+        return {"classification": "SCAM", "reason": f"Mock: mentions {', '.join(hits[:3])}", "confidence": min(60 + 10 * len(hits), 99)}
+    return {"classification": "SAFE", "reason": "Mock: no scam signals", "confidence": 80}
+
+
+def call_kind(system_prompt):
+    if "YOUR JOB HAS TWO STEPS" in system_prompt:
+        return "single_call"
+    if "Mrs. Higgins" in system_prompt:
+        return "higgins"
+    if '"results"' in system_prompt:
+        return "gatekeeper_batch"
+    return "gatekeeper"
+
+
+def completion_for(kind, user_input):
+    if kind == "single_call":
+        verdict = verdict_for(user_input)
+        if verdict["classification"] == "SAFE":
+            return {**verdict, "reply": None, "agentNotes": ""}
+        return {**verdict, **completion_for("higgins", user_input)}
+    if kind == "higgins":
+        return {
+            "reply": "oh dear... my hands are shaking... which number should i call? can you send your upi again plz",
+            "extracted_intelligence": {"bankAccounts": [], "upiIds": [], "phishingLinks": [], "phoneNumbers": [], "suspiciousKeywords": ["urgent"]},
+            "agentNotes": "Mock: stalling for a phone number",
+        }
+    if kind == "gatekeeper_batch":
+        try:
+            items = json.loads(user_input)
+        except ValueError:
+            items = []
+        return {"results": [{"index": item.get("index"), **verdict_for(item.get("message", ""))} for item in items]}
+    return verdict_for(user_input)
+
+
+MODELS = ["llama-3.3-70b-versatile", "llama-3.1-8b-instant"]
+
+
+def is_small_model(model):
+    return "8b" in model or "instant" in model
+
+
+def create_app(latency_ms=300, jitter_ms=100, token_ms=8, rate_limit=0.0, rpm=0, seed=None, small_speedup=3.0):
+    app = FastAPI()
+    rng = random.Random(seed)
+    recent = deque()  # request timestamps in the last minute, for --rpm
+    stats = {"calls": {}, "rate_limited": 0, "warmups": 0}
+
+    def record(kind, seconds, prompt_tokens, completion_tokens):
+        entry = stats["calls"].setdefault(kind, {"count": 0, "latencies": [], "prompt_tokens": 0, "completion_tokens": 0})
+        entry["count"] += 1
+        entry["latencies"].append(seconds)
+        entry["prompt_tokens"] += prompt_tokens
+        entry["completion_tokens"] += completion_tokens
+
+    def rate_headers():
+        remaining = max(0, rpm - len(recent)) if rpm else 14400
+        return {
+            "x-ratelimit-limit-requests": str(rpm or 14400),
+            "x-ratelimit-remaining-requests": str(remaining),
+            "x-ratelimit-reset-requests": "60s" if rpm else "6s",
+            "x-ratelimit-limit-tokens": "300000",
+            "x-ratelimit-remaining-tokens": "299000",
+            "x-ratelimit-reset-tokens": "200ms",
+        }
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages") or []
+        system_prompt = next((m["content"] for m in messages if m.get("role") == "system"), "")
+        user_input = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        kind = call_kind(system_prompt)
+
+        now = time.monotonic()
+        while recent and recent[0] < now - 60:
+            recent.popleft()
+        if (rpm and len(recent) >= rpm) or rng.random() < rate_limit:
+            stats["rate_limited"] += 1
+            headers = {**rate_headers(), "retry-after": "1"}
+            error = {"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}}
+            return JSONResponse(error, status_code=429, headers=headers)
+        recent.append(now)
+
+        model = body.get("model", "mock")
+        delay = max(0.0, rng.gauss(latency_ms, jitter_ms) / 1000) if jitter_ms else latency_ms / 1000
+        if is_small_model(model):
+            delay /= small_speedup
+            kind = f"{kind}:small"
+        content = json.dumps(completion_for(kind.split(":")[0], user_input))
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4 + 1
+        completion_tokens = len(content) // 4 + 1
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay)
+            record(kind, time.monotonic() - now, prompt_tokens, completion_tokens)
+            return JSONResponse({
+                "id": f"chatcmpl-mock-{rng.getrandbits(48):x}",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            }, headers=rate_headers())
+
+        async def events():
+            await asyncio.sleep(delay)  # time to first token
+            for i in range(0, len(content), 6):
+                chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {"content": content[i:i + 6]}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(token_ms / 1000)
+            record(kind, time.monotonic() - now, prompt_tokens, completion_tokens)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers=rate_headers())
+
+    @app.get("/openai/v1/models")
+    async def list_models():
+        # What the app's startup warm-up calls (GROQ_WARMUP=1)
+        stats["warmups"] += 1
+        return {"object": "list", "data": [{"id": name, "object": "model", "owned_by": "mock"} for name in MODELS]}
+
+    @app.get("/stats")
+    async def get_stats():
+        calls = {}
+        for kind, entry in stats["calls"].items():
+            calls[kind] = {
+                "count": entry["count"],
+                "p50_ms": round(percentile(entry["latencies"], 50) * 1000, 1),
+                "p95_ms": round(percentile(entry["latencies"], 95) * 1000, 1),
+                "p99_ms": round(percentile(entry["latencies"], 99) * 1000, 1),
+                "prompt_tokens": entry["prompt_tokens"],
+                "completion_tokens": entry["completion_tokens"],
+            }
+        return {"calls": calls, "rate_limited": stats["rate_limited"], "warmups": stats["warmups"]}
+
+    @app.post("/reset")
+    async def reset():
+        stats["calls"].clear()
+        stats["rate_limited"] = 0
+        stats["warmups"] = 0
+        return {"status": "reset"}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Groq/OpenAI chat completions server")
+    parser.add_argument("--port", type=int, default=9101)
+    parser.add_argument("--latency-ms", type=float, default=300, help="Mean latency (time to first token when streaming)")
+    parser.add_argument("--jitter-ms", type=float, default=100, help="Std deviation of the latency")
+    parser.add_argument("--token-ms", type=float, default=8, help="Delay between streamed chunks")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Fraction of calls answered with 429")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests-per-minute quota (429 beyond it), 0 = unlimited")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--small-speedup", type=float, default=3.0, help="How much faster *8b*/*instant* models answer")
+    args = parser.parse_args()
+    app = create_app(args.latency_ms, args.jitter_ms, args.token_ms, args.rate_limit, args.rpm, args.seed,
+                     args.small_speedup)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
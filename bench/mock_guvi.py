@@ -0,0 +1,64 @@
+import random
+import asyncio
+import argparse
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# ==============================================================================
+# MOCK GUVI REPORTING SINK FOR BENCHMARKS
+# ==============================================================================
+# Accepts the intelligence reports that reporter.py POSTs, with optional latency
+# and a failure rate (503s) to exercise retries. Point the app at it with
+# GUVI_REPORT_URL=http://127.0.0.1:<port>/api/updateHoneyPotFinalResult.
+#
+#   python -m bench.mock_guvi --port 9102 --latency-ms 200 --fail-rate 0.1
+#
+# GET /stats returns how many reports arrived (and how many distinct sessions).
+
+
+def create_app(latency_ms=50, fail_rate=0.0, seed=None):
+    app = FastAPI()
+    rng = random.Random(seed)
+    stats = {"received": 0, "failed": 0, "sessions": set()}
+
+    @app.post("/{path:path}")
+    async def report(path: str, request: Request):
+        payload = await request.json()
+        await asyncio.sleep(latency_ms / 1000)
+        if rng.random() < fail_rate:
+            stats["failed"] += 1
+            return JSONResponse({"status": "error", "message": "mock failure"}, status_code=503)
+        stats["received"] += 1
+        stats["sessions"].add(payload.get("sessionId"))
+        return {"status": "success"}
+
+    @app.get("/stats")
+    async def get_stats():
+        return {
+            "received": stats["received"],
+            "failed": stats["failed"],
+            "sessions": len(stats["sessions"]),
+        }
+
+    @app.post("/reset")
+    async def reset():
+        stats.update({"received": 0, "failed": 0, "sessions": set()})
+        return {"status": "reset"}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock GUVI reporting endpoint")
+    parser.add_argument("--port", type=int, default=9102)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of reports answered with 503")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency_ms, args.fail_rate, args.seed), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
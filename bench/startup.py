@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+import httpx
+
+from bench.loadgen import ROOT, start_mock, git_commit, percentile
+
+# ==============================================================================
+# COLD-START BENCHMARK
+# ==============================================================================
+# Starts the real server (uvicorn main:app, like the Procfile) in a fresh process,
+# against the mock Groq / GUVI servers, and times from spawn to:
+#   - healthz     first answer from GET /healthz (the port is open)
+#   - ready       /healthz says "ok" (agent.py loaded)
+#   - ui          GET / answered
+#   - first_chat  first POST /chat answered
+# It also reports the app's own startup phases (from /healthz) and the slowest
+# top-level imports from `python -X importtime`:
+#
+#   python -m bench.startup --runs 5 --out startup_result.json
+
+def top_imports(stderr_text, limit):
+    # "import time: self [us] | cumulative | name" - top-level modules have no indentation
+    imports = []
+    for line in stderr_text.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):
+            imports.append((int(cumulative) / 1000, name.strip()))
+    imports.sort(reverse=True)
+    return [{"module": name, "ms": round(ms, 1)} for ms, name in imports[:limit]]
+
+
+def wait_for(url, predicate, deadline, method="GET", **kwargs):
+    while time.perf_counter() < deadline:
+        try:
+            response = httpx.request(method, url, timeout=30, **kwargs)
+            if predicate(response):
+                return response
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"timed out waiting for {url}")
+
+
+def cold_start(args, env):
+    base = f"http://127.0.0.1:{args.port}"
+    started = time.perf_counter()
+    deadline = started + args.timeout
+    process = subprocess.Popen(
+        [sys.executable, "-X", "importtime", "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+    )
+    try:
+        timings = {}
+        wait_for(f"{base}/healthz", lambda r: r.status_code in (200, 503), deadline)
+        timings["healthz"] = time.perf_counter() - started
+        health = wait_for(f"{base}/healthz", lambda r: r.json()["status"] != "starting", deadline).json()
+        if health["status"] != "ok":
+            raise RuntimeError(f"the agent failed to load: {health}")
+        timings["ready"] = time.perf_counter() - started
+        wait_for(base + "/", lambda r: r.status_code == 200, deadline, headers={"Accept-Encoding": "gzip"})
+        timings["ui"] = time.perf_counter() - started
+        wait_for(f"{base}/chat", lambda r: r.status_code == 200, deadline, method="POST",
+                 json={"message": args.message}, headers={"x-api-key": env["APP_PASSWORD"]})
+        timings["first_chat"] = time.perf_counter() - started
+        time.sleep(args.settle_seconds)  # let the background warm-up report its phase
+        phases = httpx.get(f"{base}/healthz").json()["startup_ms"]
+    finally:
+        process.terminate()
+        _, stderr_text = process.communicate(timeout=10)
+    return {name: round(seconds * 1000, 1) for name, seconds in timings.items()}, phases, stderr_text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the server's cold start and print a JSON report")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=9103)
+    parser.add_argument("--groq-port", type=int, default=9101)
+    parser.add_argument("--guvi-port", type=int, default=9102)
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--message", default="Your SBI account is blocked. Update KYC at http://bit.ly/sbi-kyc now")
+    parser.add_argument("--top-imports", type=int, default=12)
+    parser.add_argument("--settle-seconds", type=float, default=0.5)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--out", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    mocks = [
+        start_mock("bench.mock_groq", args.groq_port, ["--latency-ms", str(args.llm_latency_ms), "--jitter-ms", "0"]),
+        start_mock("bench.mock_guvi", args.guvi_port, []),
+    ]
+    env = dict(os.environ,
+               GROQ_BASE_URL=f"http://127.0.0.1:{args.groq_port}",
+               GUVI_REPORT_URL=f"http://127.0.0.1:{args.guvi_port}/api/updateHoneyPotFinalResult",
+               GROQ_API_KEY=os.environ.get("GROQ_API_KEY", "mock-key"),
+               APP_PASSWORD=os.environ.get("APP_PASSWORD", "local-dev-key"),
+               GATEKEEPER_VERDICT_LOG="", INTEL_STORE_PATH="")  # keep mock data out of the real files
+    try:
+        runs = [cold_start(args, env) for _ in range(args.runs)]
+    finally:
+        for process in mocks:
+            process.terminate()
+            process.wait(timeout=5)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "runs": args.runs,
+        "from_spawn_ms": {
+            name: {"p50": percentile([run[0][name] for run in runs], 50), "max": max(run[0][name] for run in runs)}
+            for name in runs[0][0]
+        },
+        "startup_phases_ms": runs[-1][1],
+        "top_imports": top_imports(runs[-1][2], args.top_imports),
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# ==============================================================================
+# LLM CASSETTES (RECORD / REPLAY)
+# ==============================================================================
+# A cassette is a JSONL file of LLM answers keyed by a hash of (model, system
+# prompt, user input), with the token usage and latency of the original call.
+#   record - make the real call and append its answer to the cassette
+#   replay - answer from the cassette only (no network); a call that was never
+#            recorded fails with CassetteMiss
+#   auto   - replay what is recorded, record the rest
+# Replayed answers still go through the LLM scheduler and wait their recorded
+# latency (times latency_scale), so a replay behaves like the recorded run -
+# deterministically, offline, and without spending quota. Any prompt change
+# changes the key, so edited prompts have to be recorded again.
+# bench/evaluate.py uses this to score the pipeline on a labelled corpus.
+
+MODES = ("record", "replay", "auto")
+
+_calls = contextvars.ContextVar("cassette_calls", default=None)
+
+
+class CassetteMiss(Exception):
+    """Replay-only cassette and this LLM call was never recorded."""
+
+
+class Cassette:
+    def __init__(self, path, mode="replay", latency_scale=1.0):
+        if mode not in MODES:
+            raise ValueError(f"cassette mode must be one of {', '.join(MODES)}, got {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.entries = {}
+        self.used = set()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[entry["key"]] = entry  # a later recording of the same call wins
+
+    def lookup(self, key):
+        """The recorded entry, or None (the caller makes the real call). Raises CassetteMiss in replay mode."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.used.add(key)
+        if entry is None and self.mode == "replay":
+            raise CassetteMiss("LLM call not in the cassette - record it first (mode record or auto)")
+        return entry
+
+    def delay(self, entry):
+        return entry.get("latency_ms", 0) / 1000 * self.latency_scale
+
+    def record(self, key, model, stage, content, usage, seconds):
+        if self.mode == "replay":
+            return
+        entry = {
+            "key": key,
+            "model": model,
+            "stage": stage,
+            "content": content,
+            "usage": usage_dict(usage),
+            "latency_ms": round(seconds * 1000, 1),
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        with self.lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.entries[key] = entry
+            self.used.add(key)
+            self.recorded += 1
+
+    def prune(self):
+        """Rewrites the cassette with only the calls used since it was loaded. Returns how many were dropped."""
+        with self.lock:
+            kept = [entry for key, entry in self.entries.items() if key in self.used]
+            dropped = len(self.entries) - len(kept)
+            with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                for entry in kept:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(self.path + ".tmp", self.path)
+            self.entries = {entry["key"]: entry for entry in kept}
+        return dropped
+
+    def stats(self):
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses, "recorded": self.recorded}
+
+
+def usage_dict(usage):
+    # Groq's usage object, or the dict a cassette stored
+    get = usage.get if isinstance(usage, dict) else lambda name, default: getattr(usage, name, default)
+    return {name: get(name, 0) or 0 for name in ("prompt_tokens", "completion_tokens", "total_tokens")}
+
+
+# --- PER-MESSAGE CAPTURE (for the evaluation harness) ---
+@contextmanager
+def capture():
+    """Collects every LLM call (replayed or live) made inside the block - including tasks it starts."""
+    calls = []
+    token = _calls.set(calls)
+    try:
+        yield calls
+    finally:
+        _calls.reset(token)
+
+
+def note_call(stage, model, usage, seconds, source):
+    calls = _calls.get()
+    if calls is not None:
+        calls.append({"stage": stage, "model": model, "tokens": usage_dict(usage)["total_tokens"],
+                      "latency_ms": round(seconds * 1000, 1), "source": source})
@@ -0,0 +1,159 @@
+import os
+import sys
+import json
+import math
+import argparse
+from collections import Counter
+
+from tokens import estimate_tokens
+from verdict_cache import normalize
+
+# ==============================================================================
+# THE EXAMPLE BANK (RETRIEVAL-BASED FEW-SHOT FOR THE GATEKEEPER)
+# ==============================================================================
+# The Gatekeeper's SAFE/SCAM training examples live in data/gatekeeper_examples.jsonl
+# instead of being pasted into every prompt. Each example is indexed by character
+# 3-grams + words (TF-IDF, cosine similarity). For each message we only inject the
+# top-k most similar SAFE and SCAM examples, so the prompt stays the same size no
+# matter how many examples the bank holds.
+#
+# Run `python example_bank.py "some message"` (or `--file messages.txt`) to see the
+# prompt token count per message with all examples vs. with retrieval.
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gatekeeper_examples.jsonl")
+LABELS = ("SAFE", "SCAM")
+SECTION_TITLES = {"SAFE": "[GENUINE / SAFE EXAMPLES]", "SCAM": "[SCAM EXAMPLES]"}
+
+
+def features(text):
+    normalized = normalize(text)
+    padded = f" {normalized} "
+    grams = Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+    grams.update(f"w:{word}" for word in normalized.split())
+    return grams
+
+
+def render_examples(examples):
+    """The "### TRAINING DATA" block of the Gatekeeper prompt for the given examples."""
+    lines = ["### TRAINING DATA (Use these examples to decide):"]
+    for label in LABELS:
+        lines.append(SECTION_TITLES[label])
+        for example in examples:
+            if example["label"] == label:
+                lines.append(f'- "{example["text"]}" (Reason: {example["reason"]}){example.get("end", "")}')
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+class ExampleBank:
+    def __init__(self, examples=None):
+        self.examples = []
+        self.vectors = []
+        self.index = {}  # feature -> [(example id, weight)]
+        self.idf = {}
+        self.dirty = False
+        for example in examples or []:
+            self.add(example["text"], example["label"], example.get("reason", ""), example.get("end", ""), rebuild=False)
+        self._rebuild()
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.loads(line) for line in f if line.strip())
+
+    def add(self, text, label, reason="", end="", rebuild=True):
+        # `end` is any punctuation after "(Reason: ...)", kept so the full prompt renders as it was written
+        label = label.upper()
+        if label not in LABELS:
+            raise ValueError(f"label must be one of {LABELS}, got {label!r}")
+        self.examples.append({"text": text, "label": label, "reason": reason, "end": end})
+        self.dirty = True
+        if rebuild:
+            self._rebuild()
+
+    def select(self, text, k):
+        """Top-k most similar examples per label, most similar first. Falls back to bank order on ties."""
+        if self.dirty:
+            self._rebuild()
+        scores = [0.0] * len(self.examples)
+        for feature, weight in self._vector(features(text)).items():
+            for example_id, example_weight in self.index.get(feature, ()):
+                scores[example_id] += weight * example_weight
+
+        chosen = []
+        for label in LABELS:
+            ranked = sorted(
+                (i for i, example in enumerate(self.examples) if example["label"] == label),
+                key=lambda i: -scores[i],  # sorted() is stable, so equal scores keep bank order
+            )
+            chosen.extend(self.examples[i] for i in ranked[:k])
+        return chosen
+
+    def select_many(self, texts, k, limit_per_label=None):
+        # Union of the top-k for several messages (batch mode), without duplicates
+        chosen, seen = [], set()
+        counts = Counter()
+        for text in texts:
+            for example in self.select(text, k):
+                if example["text"] in seen:
+                    continue
+                if limit_per_label and counts[example["label"]] >= limit_per_label:
+                    continue
+                seen.add(example["text"])
+                counts[example["label"]] += 1
+                chosen.append(example)
+        return chosen
+
+    # --- INTERNALS ---
+    def _vector(self, grams):
+        vector = {g: (1 + math.log(count)) * self.idf[g] for g, count in grams.items() if g in self.idf}
+        norm = math.sqrt(sum(w * w for w in vector.values())) or 1.0
+        return {g: w / norm for g, w in vector.items()}
+
+    def _rebuild(self):
+        all_grams = [features(example["text"]) for example in self.examples]
+        document_frequency = Counter(g for grams in all_grams for g in grams)
+        total = len(self.examples)
+        self.idf = {g: math.log((total + 1) / (df + 1)) + 1 for g, df in document_frequency.items()}
+        self.vectors = [self._vector(grams) for grams in all_grams]
+        self.index = {}
+        for example_id, vector in enumerate(self.vectors):
+            for g, w in vector.items():
+                self.index.setdefault(g, []).append((example_id, w))
+        self.dirty = False
+
+
+# ==============================================================================
+# PROMPT TOKEN REPORT (CLI)
+# ==============================================================================
+def main():
+    parser = argparse.ArgumentParser(description="Gatekeeper prompt tokens per message: all examples vs. top-k retrieval.")
+    parser.add_argument("messages", nargs="*", help="Messages to check (default: read --file or stdin, one per line)")
+    parser.add_argument("--file", help="Text file with one message per line")
+    parser.add_argument("--k", type=int, default=None, help="Examples per label (default: GATEKEEPER_FEW_SHOT_K)")
+    args = parser.parse_args()
+
+    import agent  # late import: only the CLI needs the prompts
+
+    k = args.k if args.k is not None else agent.GATEKEEPER_FEW_SHOT_K
+    messages = args.messages
+    if not messages:
+        source = open(args.file, encoding="utf-8") if args.file else sys.stdin
+        messages = [line.strip() for line in source if line.strip()]
+
+    total_before = total_after = 0
+    for message in messages:
+        before = estimate_tokens(agent.GATEKEEPER_PROMPT) + estimate_tokens(message)
+        after = estimate_tokens(agent.gatekeeper_prompt_for(message, k)) + estimate_tokens(message)
+        total_before += before
+        total_after += after
+        print(f"{before:6d} -> {after:6d} tokens  {message[:70]}")
+
+    if messages:
+        saved = 100 * (1 - total_after / total_before)
+        print(f"\n{len(messages)} messages, {len(agent.example_bank.examples)} examples in the bank, k={k}")
+        print(f"avg {total_before / len(messages):.0f} -> {total_after / len(messages):.0f} prompt tokens per request ({saved:.0f}% fewer)")
+
+
+if __name__ == "__main__":
+    main()
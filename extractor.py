@@ -0,0 +1,190 @@
+import re
+
+# ==============================================================================
+# THE LOCAL EXTRACTOR (IDENTIFIERS WITHOUT THE LLM)
+# ==============================================================================
+# Pulls UPI IDs, phone numbers, bank accounts, IFSC codes and links straight out
+# of the scammer's message with precompiled regexes. Cheap enough to run on
+# every message (SAFE ones included). merge_intelligence() then folds in what
+# Mrs. Higgins' LLM reported, keeping only items that are well-formed AND
+# actually appear in the scammer's text - so hallucinated identifiers are dropped.
+
+IDENTIFIER_KEYS = ["bankAccounts", "upiIds", "phishingLinks", "phoneNumbers"]
+GUVI_KEYS = IDENTIFIER_KEYS + ["suspiciousKeywords"]
+
+# Mrs. Higgins' own fake details (HIGGINS_PROMPT) - never report these as the scammer's
+PERSONA_DATA = frozenset({"+918765890023"})
+
+# --- PATTERNS ---
+URL = re.compile(
+    r"(?:https?://|www\.)[^\s<>\"']+"
+    r"|(?<![@\w.\-])(?:[a-z0-9\-]+\.)+(?:com|in|co|ly|io|app|net|org|xyz|link|me|info|top|site|online|dev|gd|at|cc)(?:/[^\s<>\"']*)?",
+    re.IGNORECASE,
+)
+SHORTENERS = frozenset({
+    "bit.ly", "tinyurl.com", "cutt.ly", "is.gd", "t.ly", "rb.gy", "shorturl.at", "goo.gl", "tiny.cc",
+    "ow.ly", "t.co", "s.id",
+})
+TUNNELS = ("ngrok.io", "ngrok-free.app", "ngrok.app", "ngrok.dev", "trycloudflare.com", "loca.lt")
+# Handle must not be followed by ".tld" - that would be an email address
+UPI_ID = re.compile(r"(?<![\w.\-])([a-z0-9][a-z0-9.\-_]{1,255})@([a-z][a-z0-9]{1,63})\b(?!\.[a-z])", re.IGNORECASE)
+KNOWN_UPI_HANDLES = frozenset({
+    "ybl", "ibl", "axl", "paytm", "upi", "apl", "okaxis", "oksbi", "okhdfcbank", "okicici", "icici",
+    "sbi", "hdfcbank", "axisbank", "kotak", "fbl", "yesbank", "pthdfc", "ptsbi", "ptaxis", "ptyes",
+    "jupiteraxis", "freecharge", "airtel", "jio", "waaxis", "wahdfcbank", "wasbi", "idfcbank", "indus",
+    "barodampay", "unionbank", "pnb", "cnrb", "boi", "federal", "rbl", "abfspay", "axisb", "ikwik",
+})
+PHONE = re.compile(r"(?<![\d\w])(?:\+|00)?(?:91[\s\-]?|0)?([6-9]\d{2}[\s\-]?\d{2}[\s\-]?\d{5}|[6-9]\d{4}[\s\-]?\d{5})(?![\d])")
+LONG_NUMBER = re.compile(r"(?<![\d\w])\d(?:[\s\-]?\d){8,17}(?![\d])")
+ACCOUNT_CONTEXT = re.compile(r"\b(?:a/?c|acc(?:ount)?|acct)\b", re.IGNORECASE)
+BANK_CONTEXT = re.compile(r"\b(?:bank|ifsc|no\.?|number|beneficiary)\b", re.IGNORECASE)
+NOT_ACCOUNT_CONTEXT = re.compile(r"\b(?:aadhaa?r|pan|otp|order|invoice|ref(?:erence)?|txn|transaction)\b", re.IGNORECASE)
+IFSC = re.compile(r"\b([A-Z]{4}0[A-Z0-9]{6})\b")
+KEYWORDS = re.compile(
+    r"\b(urgent(?:ly)?|immediately|blocked|suspended|disconnected|kyc|otp|pin|cvv|verify|expire[sd]?|"
+    r"refund|lottery|prize|reward|cashback|penalty|arrest|legal action|last chance|final (?:notice|reminder)|"
+    r"click|update|pan|aadhaar)\b",
+    re.IGNORECASE,
+)
+PAYMENT_CONTEXT = re.compile(r"\b(?:upi|vpa|gpay|google pay|phonepe|paytm|bhim|pay|send|transfer)\b", re.IGNORECASE)
+NON_DIGIT = re.compile(r"\D")
+TOLL_FREE_PREFIXES = ("1800", "1860")  # 1800-425-3800 is a helpline, not an account
+
+
+# --- NORMALIZERS (also used to validate LLM output) ---
+def normalize_phone(raw):
+    digits = NON_DIGIT.sub("", raw)
+    if digits.startswith("00"):
+        digits = digits[2:]
+    if len(digits) == 11 and digits.startswith("0"):
+        digits = digits[1:]
+    if len(digits) == 12 and digits.startswith("91"):
+        digits = digits[2:]
+    if len(digits) != 10 or digits[0] not in "6789":
+        return None
+    return "+91" + digits
+
+
+def normalize_upi(raw):
+    match = UPI_ID.fullmatch(raw.strip())
+    if not match:
+        return None
+    return f"{match.group(1).lower()}@{match.group(2).lower()}"
+
+
+def normalize_account(raw):
+    digits = NON_DIGIT.sub("", raw)
+    return digits if 9 <= len(digits) <= 18 else None
+
+
+def normalize_link(raw):
+    link = raw.strip().rstrip(".,;:!?)]}'\"")
+    if not link.lower().startswith(("http://", "https://")):
+        link = "http://" + link
+    scheme, _, rest = link.partition("://")
+    host, slash, path = rest.partition("/")
+    return f"{scheme.lower()}://{host.lower()}{slash}{path}"
+
+
+def link_domain(link):
+    host = link.split("://", 1)[-1].split("/", 1)[0].split(":", 1)[0].lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def needs_unshortening(link):
+    domain = link_domain(link)
+    return domain in SHORTENERS or domain.endswith(TUNNELS)
+
+
+# --- EXTRACTION ---
+def _unique(items):
+    return list(dict.fromkeys(i for i in items if i))
+
+
+def extract_intelligence(text):
+    """Identifiers found in the text, normalized. Same keys as Mrs. Higgins' extracted_intelligence."""
+    text = text or ""
+
+    links = _unique(normalize_link(m.group(0)) for m in URL.finditer(text))
+    # Strip links first so digits inside URLs aren't read as phones/accounts
+    rest = URL.sub(" ", text)
+
+    # Known PSP handles (@ybl, @oksbi...) always count; other handles only if the text talks about paying
+    paying = bool(PAYMENT_CONTEXT.search(text))
+    upi_ids = []
+    for m in UPI_ID.finditer(rest):
+        if paying or m.group(2).lower() in KNOWN_UPI_HANDLES:
+            upi_ids.append(normalize_upi(m.group(0)))
+    rest = UPI_ID.sub(" ", rest)
+
+    phones = [normalize_phone(m.group(0)) for m in PHONE.finditer(rest)]
+
+    accounts = []
+    for m in LONG_NUMBER.finditer(rest):
+        digits = normalize_account(m.group(0))
+        if not digits or digits.startswith(TOLL_FREE_PREFIXES):
+            continue
+        window = rest[max(0, m.start() - 30):m.start()]
+        if NOT_ACCOUNT_CONTEXT.search(window):
+            continue
+        is_account = ACCOUNT_CONTEXT.search(window)
+        # A bare 10-digit 6-9xxx number is a phone unless the text says it's an account
+        if normalize_phone(m.group(0)) and not is_account:
+            continue
+        # Long numbers are also order IDs, helplines, tracking numbers... - only the context makes an account
+        if is_account or BANK_CONTEXT.search(window):
+            accounts.append(digits)
+    phones = [p for p in phones if p and NON_DIGIT.sub("", p)[2:] not in accounts]
+
+    return {
+        "bankAccounts": _unique(accounts),
+        "upiIds": _unique(upi_ids),
+        "phishingLinks": links,
+        "phoneNumbers": [p for p in _unique(phones) if p not in PERSONA_DATA],
+        "suspiciousKeywords": _unique(m.group(0).lower() for m in KEYWORDS.finditer(text)),
+        "ifscCodes": _unique(IFSC.findall(text)),
+        "shortenedLinks": [l for l in links if needs_unshortening(l)],
+    }
+
+
+def has_identifiers(intelligence):
+    return any((intelligence or {}).get(k) for k in IDENTIFIER_KEYS)
+
+
+# --- MERGING WITH THE LLM ---
+NORMALIZERS = {
+    "bankAccounts": normalize_account,
+    "upiIds": normalize_upi,
+    "phishingLinks": normalize_link,
+    "phoneNumbers": normalize_phone,
+}
+
+
+def _seen_in(value, key, text, text_digits):
+    if key in ("bankAccounts", "phoneNumbers"):
+        return NON_DIGIT.sub("", value)[-10:] in text_digits
+    if key == "phishingLinks":
+        return link_domain(value) in text
+    return value in text
+
+
+def merge_intelligence(local, llm, source_text):
+    """Local extraction + LLM extraction, keeping only LLM items that are valid and present in source_text."""
+    merged = {key: list(values) for key, values in local.items()}
+    llm = llm if isinstance(llm, dict) else {}
+    lowered = (source_text or "").lower()
+    text_digits = NON_DIGIT.sub("", lowered)
+
+    for key, normalize in NORMALIZERS.items():
+        for raw in llm.get(key) or []:
+            value = normalize(str(raw))
+            if not value or value in merged[key] or value in PERSONA_DATA:
+                continue
+            if _seen_in(value.lower(), key, lowered, text_digits):
+                merged[key].append(value)
+
+    # Keywords can't be hallucinated in a harmful way - keep the LLM's too
+    keywords = merged.get("suspiciousKeywords", []) + [str(k).lower() for k in llm.get("suspiciousKeywords") or []]
+    merged["suspiciousKeywords"] = _unique(keywords)
+    merged["shortenedLinks"] = [l for l in merged["phishingLinks"] if needs_unshortening(l)]
+    return merged
@@ -0,0 +1,326 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from collections import OrderedDict
+
+from background_writer import BackgroundWriter
+from extractor import normalize_upi, normalize_phone, normalize_account, normalize_link, link_domain, needs_unshortening
+
+# ==============================================================================
+# THE INTELLIGENCE STORE (PERSISTENT, CROSS-SESSION CORRELATION)
+# ==============================================================================
+# Every identifier a scammer hands us (UPI ID, phone, bank account, link domain)
+# is kept in an append-only SQLite table, so we can tell when the same mule
+# account or phishing domain turns up again in another conversation.
+#   - /chat never touches the disk: sightings go on an in-memory queue and a
+#     background writer thread inserts them in batches (WAL mode, one transaction
+#     per batch). Repeats are answered from an in-memory index of the most recently
+#     seen identifiers, loaded from the database at startup.
+#   - lookup() answers "seen before? in how many sessions? when?" from that index;
+#     history() reads the individual sightings from SQLite (off the request path).
+#
+#   python intel_store.py lookup "fraud.kyc@ybl"     # one identifier (kind guessed)
+#   python intel_store.py top --limit 20             # identifiers seen in the most sessions
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sightings (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    seen_at REAL NOT NULL,
+    raw TEXT
+);
+CREATE INDEX IF NOT EXISTS sightings_identifier ON sightings (kind, value, session_id, seen_at);
+CREATE INDEX IF NOT EXISTS sightings_seen_at ON sightings (seen_at);
+"""
+
+# intelligence key -> kind stored in the database
+KINDS = {
+    "upiIds": "upi",
+    "phoneNumbers": "phone",
+    "bankAccounts": "bank_account",
+    "phishingLinks": "link_domain",
+}
+
+
+def link_key(link):
+    # The domain identifies a phishing site - except for shorteners / tunnels, which every
+    # scammer shares, so there the whole short link is the identifier
+    domain = link_domain(link)
+    if needs_unshortening(link):
+        path = link.split("://", 1)[-1].partition("/")[2].rstrip("/")
+        return f"{domain}/{path}" if path else domain
+    return domain
+
+
+def normalize_identifier(kind, value):
+    """Index key for one identifier, or None if it isn't a valid one of that kind."""
+    value = str(value or "").strip()
+    if not value:
+        return None
+    if kind == "upi":
+        return normalize_upi(value)
+    if kind == "phone":
+        return normalize_phone(value)
+    if kind == "bank_account":
+        return normalize_account(value)
+    if kind == "link_domain":
+        return link_key(normalize_link(value))
+    raise ValueError(f"unknown identifier kind {kind!r} (expected one of {', '.join(KINDS.values())})")
+
+
+def guess_kind(value):
+    # For lookups typed by a human: "x@ybl" is a UPI ID, 10 digits a phone, 9-18 digits an account
+    if "@" in value and normalize_upi(value):
+        return "upi"
+    if normalize_phone(value):
+        return "phone"
+    if normalize_account(value):
+        return "bank_account"
+    return "link_domain"
+
+
+def identifier_keys(intelligence):
+    """(kind, key, raw value) for every identifier in an intelligence dict, deduplicated."""
+    keys = {}
+    for field, kind in KINDS.items():
+        for raw in (intelligence or {}).get(field) or []:
+            key = normalize_identifier(kind, raw)
+            if key and (kind, key) not in keys:
+                keys[(kind, key)] = raw
+    return [(kind, key, raw) for (kind, key), raw in keys.items()]
+
+
+def iso_time(timestamp):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp)) if timestamp else None
+
+
+class Summary:
+    __slots__ = ("first_seen", "last_seen", "sightings", "sessions", "last_session")
+
+    def __init__(self, first_seen, last_seen, sightings=0, sessions=0, last_session=None):
+        self.first_seen = first_seen
+        self.last_seen = last_seen
+        self.sightings = sightings
+        self.sessions = sessions
+        self.last_session = last_session
+
+    def to_dict(self):
+        return {
+            "sightings": self.sightings,
+            "sessions": self.sessions,
+            "first_seen": iso_time(self.first_seen),
+            "last_seen": iso_time(self.last_seen),
+        }
+
+
+class IntelStore:
+    def __init__(self, path="intelligence.db", memory_size=100000, queue_size=10000,
+                 batch_size=500, flush_interval=0.5):
+        self.path = path
+        self.memory_size = memory_size
+        # Sightings are written in batches from the writer thread (which owns the connection)
+        self.writer = BackgroundWriter(self._write, name="intel-store-writer", queue_size=queue_size,
+                                       batch_size=batch_size, flush_interval=flush_interval)
+        self.db = None
+
+        self.index = OrderedDict()  # (kind, key) -> Summary, least recently seen first
+        self.lock = threading.Lock()
+
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+        self.repeats = 0
+
+        self._setup()
+        self._load_index()
+
+    # --- PRODUCER SIDE (called from the request path, memory only) ---
+    def lookup(self, kind, value):
+        """What we know about one identifier (kind = upi / phone / bank_account / link_domain)."""
+        key = normalize_identifier(kind, value)
+        with self.lock:
+            summary = self.index.get((kind, key)) if key else None
+            known = summary.to_dict() if summary else {}
+        return {"kind": kind, "value": key or value, "seen": bool(known), **known}
+
+    def find_repeats(self, intelligence, session_id=None):
+        """Identifiers in `intelligence` already seen in another session, with when and how often."""
+        repeats = []
+        with self.lock:
+            for kind, key, _ in identifier_keys(intelligence):
+                summary = self.index.get((kind, key))
+                if summary and (summary.sessions > 1 or summary.last_session != session_id):
+                    repeats.append({"kind": kind, "value": key, **summary.to_dict()})
+        return repeats
+
+    def record(self, intelligence, session_id, new_in_session=None):
+        """
+        Records a sighting of every identifier and returns the repeats (as find_repeats, looked up
+        before this sighting is counted). `new_in_session` = identifiers this session hadn't
+        mentioned yet, so the same scammer repeating an identifier isn't counted as another session.
+        """
+        keys = identifier_keys(intelligence)
+        if not keys:
+            return []
+        new_keys = None if new_in_session is None else {(kind, key) for kind, key, _ in identifier_keys(new_in_session)}
+        now = time.time()
+        repeats = []
+        rows = []
+        with self.lock:
+            for kind, key, raw in keys:
+                summary = self.index.get((kind, key))
+                if summary is None:
+                    summary = self.index[(kind, key)] = Summary(now, now)
+                    if len(self.index) > self.memory_size:
+                        self.index.popitem(last=False)
+                else:
+                    if summary.sessions > 1 or summary.last_session != session_id:
+                        repeats.append({"kind": kind, "value": key, **summary.to_dict()})
+                    self.index.move_to_end((kind, key))
+                new_session = summary.last_session != session_id and (new_keys is None or (kind, key) in new_keys)
+                if new_session or summary.sessions == 0:
+                    summary.sessions += 1
+                summary.sightings += 1
+                summary.last_seen = now
+                summary.last_session = session_id
+                rows.append((kind, key, session_id, now, raw if raw != key else None))
+            self.recorded += len(rows)
+            self.repeats += len(repeats)
+
+        if self.path and not self.writer.put(rows):
+            with self.lock:
+                self.dropped += len(rows)  # memory index still has them; the disk copy is lost
+        return repeats
+
+    def stats(self):
+        return {
+            "recorded": self.recorded,
+            "written": self.written,
+            "dropped": self.dropped,
+            "write_errors": self.write_errors,
+            "repeats": self.repeats,
+            "indexed": len(self.index),
+            "queued": self.writer.pending(),
+        }
+
+    # --- QUERIES (SQLITE, OFF THE REQUEST PATH) ---
+    def history(self, kind, value, limit=20):
+        """Every session an identifier was seen in, most recent first (as written so far)."""
+        key = normalize_identifier(kind, value)
+        if not key or not self.path:
+            return []
+        rows = self._query(
+            "SELECT session_id, MIN(seen_at), MAX(seen_at), COUNT(*) FROM sightings "
+            "WHERE kind = ? AND value = ? GROUP BY session_id ORDER BY MAX(seen_at) DESC LIMIT ?",
+            (kind, key, limit),
+        )
+        return [{"sessionId": session_id, "first_seen": iso_time(first), "last_seen": iso_time(last), "sightings": count}
+                for session_id, first, last, count in rows]
+
+    def top(self, limit=20, kind=None):
+        """Identifiers seen in the most sessions."""
+        if not self.path:
+            return []
+        where, params = ("WHERE kind = ?", (kind, limit)) if kind else ("", (limit,))
+        rows = self._query(
+            f"SELECT kind, value, COUNT(DISTINCT session_id) AS sessions, COUNT(*), MIN(seen_at), MAX(seen_at) "
+            f"FROM sightings {where} GROUP BY kind, value ORDER BY sessions DESC, MAX(seen_at) DESC LIMIT ?",
+            params,
+        )
+        return [{"kind": k, "value": v, "sessions": s, "sightings": n, "first_seen": iso_time(first), "last_seen": iso_time(last)}
+                for k, v, s, n, first, last in rows]
+
+    # --- DATABASE ---
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=5)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")  # WAL + NORMAL: durable across app crashes, fast commits
+        return db
+
+    def _query(self, sql, params=()):
+        # A short-lived connection per query: WAL lets it read while the writer thread writes
+        db = self._connect()
+        try:
+            return db.execute(sql, params).fetchall()
+        finally:
+            db.close()
+
+    def _setup(self):
+        if not self.path:
+            return
+        db = self._connect()
+        try:
+            db.executescript(SCHEMA)
+        finally:
+            db.close()
+
+    def _load_index(self):
+        # The most recently seen identifiers, oldest first so the OrderedDict ends up in LRU order
+        if not self.path:
+            return
+        rows = self._query(
+            "SELECT * FROM (SELECT kind, value, MIN(seen_at), MAX(seen_at) AS last, COUNT(*), COUNT(DISTINCT session_id) "
+            "FROM sightings GROUP BY kind, value ORDER BY last DESC LIMIT ?) ORDER BY last",
+            (self.memory_size,),
+        )
+        for kind, key, first, last, sightings, sessions in rows:
+            self.index[(kind, key)] = Summary(first, last, sightings, sessions)
+
+    # --- WRITER SIDE (on the BackgroundWriter thread) ---
+    def _write(self, rows):
+        if self.db is None:
+            self.db = self._connect()
+        try:
+            with self.db:
+                self.db.executemany("INSERT INTO sightings (kind, value, session_id, seen_at, raw) VALUES (?, ?, ?, ?, ?)", rows)
+            self.written += len(rows)
+        except sqlite3.Error as e:
+            self.write_errors += len(rows)
+            print(f"Intelligence store write failed: {e}")
+
+    def flush(self, timeout=5.0):
+        """Waits (up to timeout) for queued sightings to reach the database (also runs at interpreter exit)."""
+        self.writer.flush(timeout)
+
+
+# ==============================================================================
+# CLI
+# ==============================================================================
+def main():
+    parser = argparse.ArgumentParser(description="Query the intelligence store")
+    parser.add_argument("--db", default=os.environ.get("INTEL_STORE_PATH", "intelligence.db"))
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    lookup = sub.add_parser("lookup", help="Has this identifier been seen before, in how many sessions, when?")
+    lookup.add_argument("values", nargs="+")
+    lookup.add_argument("--kind", choices=list(KINDS.values()), help="Default: guessed from the value")
+    lookup.add_argument("--limit", type=int, default=20, help="Sessions listed per identifier")
+
+    top = sub.add_parser("top", help="Identifiers seen in the most sessions")
+    top.add_argument("--kind", choices=list(KINDS.values()))
+    top.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        sys.exit(f"No intelligence store at {args.db}")
+    store = IntelStore(args.db)
+    if args.command == "top":
+        for row in store.top(args.limit, args.kind):
+            print(json.dumps(row))
+        return
+    for value in args.values:
+        kind = args.kind or guess_kind(value)
+        result = store.lookup(kind, value)
+        result["history"] = store.history(kind, value, args.limit)
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import json
+import time
+import asyncio
+import itertools
+from collections import deque
+
+# ==============================================================================
+# THE LIVE FEED (CLASSIFICATION / EXTRACTION EVENTS FOR EVERY DASHBOARD)
+# ==============================================================================
+# Every message the pipeline handles publishes a "classification" event (as soon
+# as the verdict is known) and an "extraction" event (the finished result with its
+# intelligence). GET /feed streams them to every connected dashboard as SSE.
+#   - publish() never waits: it serializes the event once, appends it to a ring
+#     buffer of recent events (replayed to late joiners) and to each subscriber's
+#     own bounded buffer. That's all /chat pays, however many dashboards listen.
+#   - A subscriber that can't keep up loses events by its own drop policy:
+#       oldest     - drop its oldest buffered events (default: the feed stays live)
+#       newest     - drop new events until it catches up
+#       disconnect - close its stream; it reconnects and replays from the ring buffer
+#     Dropped events are announced with a "dropped" event, and every event has an
+#     increasing id, so gaps are visible.
+
+DROP_POLICIES = ("oldest", "newest", "disconnect")
+
+
+class FeedFull(Exception):
+    """Too many dashboards connected."""
+
+
+class Subscriber:
+    def __init__(self, buffer_size, drop_policy):
+        self.events = deque()
+        self.buffer_size = buffer_size
+        self.drop_policy = drop_policy
+        self.wakeup = asyncio.Event()
+        self.dropped = 0  # since the last "dropped" notice
+        self.closed = False
+
+    def offer(self, event):
+        # Called by publish(); returns False if the subscriber has to be disconnected
+        if len(self.events) >= self.buffer_size:
+            if self.drop_policy == "disconnect":
+                self.closed = True
+                self.wakeup.set()
+                return False
+            self.dropped += 1
+            if self.drop_policy == "newest":
+                return True
+            self.events.popleft()
+        self.events.append(event)
+        self.wakeup.set()
+        return True
+
+
+class LiveFeed:
+    def __init__(self, history_size=200, buffer_size=100, max_subscribers=50, heartbeat_interval=15.0):
+        self.history = deque(maxlen=history_size)  # (id, name, serialized data)
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self.heartbeat_interval = heartbeat_interval
+        self.subscribers = set()
+        self.ids = itertools.count(1)
+
+        self.published = 0
+        self.dropped = 0
+        self.disconnected = 0
+
+    # --- PUBLISHING (request path, must stay cheap) ---
+    def publish(self, name, data):
+        """Broadcasts one event. Call it from the event loop thread."""
+        event = (next(self.ids), name, json.dumps({**data, "at": round(time.time(), 3)}, default=str))
+        self.history.append(event)
+        self.published += 1
+        for subscriber in list(self.subscribers):
+            before = subscriber.dropped
+            if not subscriber.offer(event):
+                self.subscribers.discard(subscriber)
+                self.disconnected += 1
+            self.dropped += subscriber.dropped - before
+
+    def stats(self):
+        return {
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "dropped": self.dropped,
+            "disconnected": self.disconnected,
+        }
+
+    # --- SUBSCRIBING (one per connected dashboard) ---
+    def subscribe(self, replay=20, last_event_id=None, drop_policy="oldest", buffer_size=None):
+        """
+        Returns an async generator of SSE-formatted chunks. Starts with the recent events: the ones after
+        `last_event_id` if the client is resuming (and we haven't restarted since), otherwise the
+        last `replay`. Raises FeedFull
+        (before yielding anything) when max_subscribers dashboards are already connected.
+        """
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"drop policy must be one of {', '.join(DROP_POLICIES)}, got {drop_policy!r}")
+        if len(self.subscribers) >= self.max_subscribers:
+            raise FeedFull(f"{self.max_subscribers} dashboards already connected")
+
+        subscriber = Subscriber(min(buffer_size or self.buffer_size, self.buffer_size), drop_policy)
+        return self._stream(subscriber, replay, last_event_id)
+
+    async def _stream(self, subscriber, replay, last_event_id):
+        # Registered on the first read, so a stream that is never started can't leak a subscriber
+        newest = self.history[-1][0] if self.history else 0
+        if last_event_id is not None and last_event_id <= newest:
+            backlog = [event for event in self.history if event[0] > last_event_id]
+        else:
+            backlog = list(self.history)[-replay:] if replay > 0 else []
+        self.subscribers.add(subscriber)
+        try:
+            yield "retry: 2000\n\n"  # how long EventSource clients wait before reconnecting
+            for event in backlog:
+                yield format_event(*event)
+            while not subscriber.closed:
+                if not subscriber.events:
+                    subscriber.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(subscriber.wakeup.wait(), self.heartbeat_interval)
+                    except asyncio.TimeoutError:
+                        yield ": ping\n\n"  # keeps proxies from closing an idle stream
+                    continue
+                if subscriber.dropped:
+                    yield f"event: dropped\ndata: {json.dumps({'count': subscriber.dropped})}\n\n"
+                    subscriber.dropped = 0
+                yield format_event(*subscriber.events.popleft())
+        finally:
+            self.subscribers.discard(subscriber)
+
+
+def format_event(event_id, name, data):
+    return f"id: {event_id}\nevent: {name}\ndata: {data}\n\n"
@@ -0,0 +1,319 @@
+import re
+import time
+import heapq
+import random
+import asyncio
+import itertools
+
+from metrics import stage_timer
+
+# ==============================================================================
+# THE LLM SCHEDULER (QUOTAS, PRIORITY, RETRIES, CIRCUIT BREAKER, COALESCING)
+# ==============================================================================
+# Every async Groq call goes through one scheduler per worker:
+#   - a concurrency cap plus token buckets for the request and token quotas, refilled
+#     from Groq's x-ratelimit-* headers, so we slow down before Groq answers 429;
+#   - a priority queue, so Gatekeeper calls (which every message needs) go before
+#     Mrs. Higgins' replies when we are short of quota;
+#   - retries with full-jitter backoff for 429 / 5xx / timeouts, honouring Retry-After
+#     (a 429 pauses the whole queue, not just the call that got it);
+#   - a circuit breaker: after N calls in a row fail, calls fail fast for a while
+#     (the caller falls back to a degraded local answer) and then one probe is let through;
+#   - in-flight coalescing: identical calls made at the same time share one request.
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_SECONDS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+class LLMUnavailable(Exception):
+    """The call failed after all retries, or the circuit breaker is open."""
+
+
+def parse_duration(value):
+    # Groq's reset headers look like "6s", "2m59.56s" or "200ms"
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(str(value))
+    return sum(float(number) * DURATION_SECONDS[unit] for number, unit in parts) if parts else None
+
+
+def header_number(headers, name):
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+class QuotaBucket:
+    """
+    Token bucket for one quota (requests or tokens). Groq tells us the limit, what is left
+    and when it is fully refilled; we assume it refills linearly until then.
+    """
+
+    def __init__(self):
+        self.limit = None  # unknown until the first response
+        self.level = 0.0
+        self.rate = 0.0  # refill per second
+        self.updated = time.monotonic()
+
+    def update(self, limit, remaining, reset_seconds):
+        if limit is None or remaining is None:
+            return
+        self.limit = limit
+        self.level = remaining
+        self.rate = (limit - remaining) / reset_seconds if reset_seconds else limit
+        self.updated = time.monotonic()
+
+    def available(self):
+        if self.limit is None:
+            return float("inf")
+        return min(self.limit, self.level + (time.monotonic() - self.updated) * self.rate)
+
+    def wait_for(self, cost):
+        # Seconds until `cost` fits in the bucket (0 = go now)
+        if self.limit is None:
+            return 0.0
+        cost = min(cost, self.limit)
+        missing = cost - self.available()
+        if missing <= 0:
+            return 0.0
+        return missing / self.rate if self.rate > 0 else 1.0
+
+    def take(self, cost):
+        if self.limit is not None:
+            self.level = self.available() - cost
+            self.updated = time.monotonic()
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrent=16, max_retries=2, backoff_base=0.5, backoff_cap=8.0,
+                 failure_threshold=5, reset_timeout=30.0, coalesce=True, retryable_errors=(Exception,)):
+        self.max_concurrent = max_concurrent
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.coalesce = coalesce
+        self.retryable_errors = retryable_errors
+
+        self.requests = QuotaBucket()
+        self.tokens = QuotaBucket()
+        self.paused_until = 0.0  # set by a 429's Retry-After
+        self.waiting = []  # heap of (priority, seq, future, token cost)
+        self.sequence = itertools.count()
+        self.in_flight = 0
+        self.wakeup = None  # timer handle while waiting for quota
+
+        self.consecutive_failures = 0
+        self.opened_at = None  # circuit breaker: None = closed
+        self.probe_started = None  # half-open: when the single probe call went out
+        self.inflight_calls = {}  # coalescing key -> [task, waiters]
+
+        self.calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.short_circuited = 0
+        self.breaker_trips = 0
+
+    # --- PUBLIC API ---
+    async def run(self, call, priority=0, token_cost=0, key=None):
+        """
+        Runs `call` (an async function returning (result, response headers)) under the quota,
+        priority, retry and breaker rules. Calls with the same `key` made while one is still
+        in flight share its result. Raises LLMUnavailable when it gives up.
+        """
+        if not (self.coalesce and key):
+            return await self._run(call, priority, token_cost)
+
+        entry = self.inflight_calls.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(self._run(call, priority, token_cost))
+            entry = self.inflight_calls[key] = [task, 0]
+            task.add_done_callback(lambda _: self.inflight_calls.pop(key, None))
+        else:
+            self.coalesced += 1
+        entry[1] += 1
+        try:
+            # shield: one caller giving up (client disconnected) must not cancel it for the others
+            return await asyncio.shield(entry[0])
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                entry[0].cancel()
+
+    def slot(self, priority=0, token_cost=0):
+        """Async context manager for calls that can't be retried transparently (streaming)."""
+        return _Slot(self, priority, token_cost)
+
+    def update_quota(self, headers):
+        if not headers:
+            return
+        self.requests.update(header_number(headers, "x-ratelimit-limit-requests"),
+                             header_number(headers, "x-ratelimit-remaining-requests"),
+                             parse_duration(headers.get("x-ratelimit-reset-requests")))
+        self.tokens.update(header_number(headers, "x-ratelimit-limit-tokens"),
+                           header_number(headers, "x-ratelimit-remaining-tokens"),
+                           parse_duration(headers.get("x-ratelimit-reset-tokens")))
+
+    def breaker_state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "short_circuited": self.short_circuited,
+            "breaker_trips": self.breaker_trips,
+            "in_flight": self.in_flight,
+            "waiting": len(self.waiting),
+        }
+
+    def quota(self):
+        requests, tokens = self.requests.available(), self.tokens.available()
+        return {
+            "requests": requests if requests != float("inf") else -1,
+            "tokens": tokens if tokens != float("inf") else -1,
+        }
+
+    # --- CALLS ---
+    async def _run(self, call, priority, token_cost):
+        self._check_breaker()
+        self.calls += 1
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(priority, token_cost)
+            retry_after = None
+            try:
+                result, headers = await call()
+            except self.retryable_errors as e:
+                response = getattr(e, "response", None)
+                headers = getattr(response, "headers", None) or {}
+                status = getattr(e, "status_code", None)
+                self.update_quota(headers)
+                if status is not None and status not in RETRYABLE_STATUS and not self._is_json_failure(e):
+                    self._record(success=True)  # our request was bad; Groq itself is fine
+                    raise
+                retry_after = parse_duration(headers.get("retry-after"))
+                if status == 429:
+                    self.rate_limited += 1
+                    self.paused_until = max(self.paused_until, time.monotonic() + (retry_after or 1.0))
+                error = e
+            else:
+                self.update_quota(headers)
+                self._record(success=True)
+                return result
+            finally:
+                self._release()
+
+            if attempt < self.max_retries:
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt, retry_after))
+
+        self._record(success=False)
+        raise LLMUnavailable(f"gave up after {self.max_retries + 1} attempts: {error}") from error
+
+    @staticmethod
+    def _is_json_failure(error):
+        # Groq answers 400 json_validate_failed when the model produced invalid JSON - worth another try
+        body = getattr(error, "body", None)
+        return "json_validate_failed" in str(body)
+
+    def _backoff(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+        return max(delay, retry_after or 0.0)
+
+    # --- CIRCUIT BREAKER ---
+    def _check_breaker(self):
+        state = self.breaker_state()
+        # A probe that never reported back (cancelled) stops counting after reset_timeout
+        probe_running = self.probe_started is not None and time.monotonic() - self.probe_started < self.reset_timeout
+        if state == "open" or (state == "half_open" and probe_running):
+            self.short_circuited += 1
+            raise LLMUnavailable("circuit breaker open")
+        if state == "half_open":
+            self.probe_started = time.monotonic()  # this call is the probe
+
+    def _record(self, success):
+        self.probe_started = None
+        if success:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            return
+        self.failures += 1
+        self.consecutive_failures += 1
+        state = self.breaker_state()
+        if state == "half_open" or (state == "closed" and self.consecutive_failures >= self.failure_threshold):
+            self.breaker_trips += 1
+            self.opened_at = time.monotonic()
+
+    # --- QUEUE ---
+    async def _acquire(self, priority, token_cost):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting, (priority, next(self.sequence), future, token_cost))
+        self._dispatch()
+        try:
+            with stage_timer("llm_queue_wait"):
+                await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()  # we were handed a slot just as we got cancelled
+            raise
+
+    def _release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.waiting and self.in_flight < self.max_concurrent:
+            priority, _, future, token_cost = self.waiting[0]
+            if future.done():  # cancelled while waiting
+                heapq.heappop(self.waiting)
+                continue
+            wait = max(self.paused_until - time.monotonic(), self.requests.wait_for(1), self.tokens.wait_for(token_cost))
+            if wait > 0:
+                if self.wakeup is None:
+                    self.wakeup = asyncio.get_running_loop().call_later(wait, self._wake)
+                return
+            heapq.heappop(self.waiting)
+            self.requests.take(1)
+            self.tokens.take(token_cost)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _wake(self):
+        self.wakeup = None
+        self._dispatch()
+
+
+class _Slot:
+    def __init__(self, scheduler, priority, token_cost):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.token_cost = token_cost
+
+    async def __aenter__(self):
+        self.scheduler._check_breaker()
+        self.scheduler.calls += 1
+        await self.scheduler._acquire(self.priority, self.token_cost)
+        return self.scheduler
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.scheduler._release()
+        if exc_type is None:
+            self.scheduler._record(success=True)
+        elif isinstance(exc, self.scheduler.retryable_errors):
+            self.scheduler.update_quota(getattr(getattr(exc, "response", None), "headers", None))
+            self.scheduler._record(success=False)
+        return False
@@ -0,0 +1,273 @@
+import os
+import sys
+import json
+import math
+import time
+import zlib
+import random
+import argparse
+
+from verdict_cache import normalize
+from background_writer import BackgroundWriter
+
+# ==============================================================================
+# THE LOCAL CLASSIFIER (CPU-ONLY TIER BEFORE THE GATEKEEPER LLM)
+# ==============================================================================
+# A logistic regression over hashed character n-grams (+ words) of the normalized
+# message. It is trained from the example bank plus the Gatekeeper's own logged
+# verdicts, and decides a message locally only when it is very sure either way;
+# everything in between still goes to the LLM.
+#
+#   python local_classifier.py train                 # examples + gatekeeper_verdicts.jsonl -> model file
+#   python local_classifier.py check "some message"  # probability of SCAM per message
+#
+# `train` also replays the verdict log and reports how many Gatekeeper calls the
+# model would have avoided at the threshold, and how often it disagreed.
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODEL_PATH = os.path.join(ROOT, "data", "local_classifier.json")
+DEFAULT_EXAMPLES_PATH = os.path.join(ROOT, "data", "gatekeeper_examples.jsonl")
+DEFAULT_VERDICT_LOG = "gatekeeper_verdicts.jsonl"
+
+DIMENSIONS = 1 << 18
+CHAR_NGRAMS = (2, 3, 4)
+MODEL_VERSION = 1
+
+
+def hashed_features(text):
+    """Sparse {bucket: value} vector, L2-normalized. Signed hashing keeps collisions from piling up."""
+    normalized = normalize(text)
+    padded = f" {normalized} "
+    grams = [padded[i:i + n] for n in CHAR_NGRAMS for i in range(len(padded) - n + 1)]
+    grams.extend(f"w:{word}" for word in normalized.split())
+
+    vector = {}
+    for gram in grams:
+        h = zlib.crc32(gram.encode())  # stable across processes, unlike hash()
+        bucket = h & (DIMENSIONS - 1)
+        vector[bucket] = vector.get(bucket, 0.0) + (1.0 if h & 0x80000000 else -1.0)
+    norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+    return {bucket: v / norm for bucket, v in vector.items() if v}
+
+
+def sigmoid(z):
+    if z < -30:
+        return 0.0
+    if z > 30:
+        return 1.0
+    return 1.0 / (1.0 + math.exp(-z))
+
+
+class LocalClassifier:
+    def __init__(self, weights=None, bias=0.0, threshold=0.95, meta=None):
+        self.weights = weights or {}
+        self.bias = bias
+        self.threshold = threshold
+        self.meta = meta or {}
+        self.decided = 0
+        self.escalated = 0
+
+    @classmethod
+    def load(cls, path=DEFAULT_MODEL_PATH, threshold=0.95):
+        """The trained model, or None if there is no model file yet (the cascade is then off)."""
+        if not path or not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != MODEL_VERSION or data.get("dimensions") != DIMENSIONS:
+            print(f"Local classifier: {path} was trained with a different feature setup - retrain it")
+            return None
+        weights = {int(bucket): w for bucket, w in data["weights"].items()}
+        return cls(weights, data["bias"], threshold, data.get("meta"))
+
+    def save(self, path):
+        data = {
+            "version": MODEL_VERSION,
+            "dimensions": DIMENSIONS,
+            "bias": round(self.bias, 6),
+            "weights": {str(bucket): round(w, 6) for bucket, w in sorted(self.weights.items()) if abs(w) >= 1e-6},
+            "meta": self.meta,
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    def probability(self, text):
+        """P(SCAM) for a message."""
+        z = self.bias + sum(self.weights.get(bucket, 0.0) * v for bucket, v in hashed_features(text).items())
+        return sigmoid(z)
+
+    def classify(self, text):
+        """A Gatekeeper-shaped verdict if the model is confident enough, otherwise None (ask the LLM)."""
+        p = self.probability(text)
+        if p >= self.threshold:
+            label, confidence = "SCAM", p
+        elif p <= 1 - self.threshold:
+            label, confidence = "SAFE", 1 - p
+        else:
+            self.escalated += 1
+            return None
+        self.decided += 1
+        return {
+            "classification": label,
+            "reason": f"Local classifier: {confidence:.0%} sure it looks like known {label} messages.",
+            "confidence": int(confidence * 100),
+        }
+
+    def stats(self):
+        return {"decided": self.decided, "escalated": self.escalated}
+
+    # --- TRAINING ---
+    def fit(self, texts, labels, epochs=30, learning_rate=0.5, l2=1e-5, seed=13):
+        """Plain SGD logistic regression. Classes are weighted so a SAFE-heavy log can't drown out SCAMs."""
+        rows = [(hashed_features(text), label) for text, label in zip(texts, labels)]
+        positives = sum(labels) or 1
+        negatives = (len(labels) - sum(labels)) or 1
+        class_weight = {1: len(labels) / (2 * positives), 0: len(labels) / (2 * negatives)}
+        rng = random.Random(seed)
+        self.weights, self.bias = {}, 0.0
+        for epoch in range(epochs):
+            rng.shuffle(rows)
+            rate = learning_rate / (1 + epoch * 0.1)
+            for vector, label in rows:
+                z = self.bias + sum(self.weights.get(b, 0.0) * v for b, v in vector.items())
+                gradient = (sigmoid(z) - label) * class_weight[label]
+                for bucket, v in vector.items():
+                    w = self.weights.get(bucket, 0.0)
+                    self.weights[bucket] = w - rate * (gradient * v + l2 * w)
+                self.bias -= rate * gradient
+        return self
+
+
+# ==============================================================================
+# TRAINING DATA
+# ==============================================================================
+class VerdictLog:
+    """
+    One JSONL line per Gatekeeper decision - the training data for the next retrain.
+    log() only queues the line; a BackgroundWriter thread appends it, so the event loop never
+    touches the disk. An empty path turns the log off.
+    """
+
+    def __init__(self, path, queue_size=10000):
+        self.path = path
+        self.writer = BackgroundWriter(self._write, name="verdict-log-writer", queue_size=queue_size)
+        self.dropped = 0
+
+    def log(self, text, verdict):
+        if not self.path:
+            return
+        line = json.dumps({"text": text, "label": verdict.get("classification"),
+                           "confidence": verdict.get("confidence"), "at": time.time()})
+        if not self.writer.put([line]):
+            self.dropped += 1  # training data, not worth blocking a request for
+
+    def _write(self, lines):
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(line + "\n" for line in lines))
+        except OSError as e:
+            print(f"Could not log Gatekeeper verdicts: {e}")
+
+    def flush(self, timeout=5.0):
+        self.writer.flush(timeout)
+
+
+def load_labelled(path):
+    rows = []
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                label = str(row.get("label", "")).upper()
+                if row.get("text") and label in ("SAFE", "SCAM"):
+                    rows.append((row["text"], label))
+    return rows
+
+
+def training_set(examples_path, log_path):
+    # Later verdicts win for the same text; hand-written examples win over the log
+    data = {}
+    for text, label in load_labelled(log_path) + load_labelled(examples_path):
+        data[text] = label
+    return list(data.items())
+
+
+def evaluate(model, rows):
+    decided = correct = 0
+    for text, label in rows:
+        verdict = model.classify(text)
+        if verdict:
+            decided += 1
+            correct += verdict["classification"] == label
+    return decided, correct
+
+
+# ==============================================================================
+# CLI
+# ==============================================================================
+def main():
+    parser = argparse.ArgumentParser(description="Train / check the local SAFE-vs-SCAM classifier")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    train = sub.add_parser("train", help="Retrain from the example bank + logged Gatekeeper verdicts")
+    train.add_argument("--examples", default=DEFAULT_EXAMPLES_PATH)
+    train.add_argument("--log", default=os.environ.get("GATEKEEPER_VERDICT_LOG", DEFAULT_VERDICT_LOG))
+    train.add_argument("--out", default=os.environ.get("LOCAL_CLASSIFIER_PATH", DEFAULT_MODEL_PATH))
+    train.add_argument("--threshold", type=float, default=float(os.environ.get("LOCAL_CLASSIFIER_THRESHOLD", "0.95")))
+    train.add_argument("--holdout", type=float, default=0.2, help="Fraction kept aside to estimate accuracy")
+    train.add_argument("--epochs", type=int, default=30)
+
+    check = sub.add_parser("check", help="Print P(SCAM) for messages")
+    check.add_argument("messages", nargs="*", help="Messages (default: stdin, one per line)")
+    check.add_argument("--model", default=os.environ.get("LOCAL_CLASSIFIER_PATH", DEFAULT_MODEL_PATH))
+    check.add_argument("--threshold", type=float, default=float(os.environ.get("LOCAL_CLASSIFIER_THRESHOLD", "0.95")))
+    args = parser.parse_args()
+
+    if args.command == "check":
+        model = LocalClassifier.load(args.model, args.threshold)
+        if not model:
+            sys.exit(f"No model at {args.model} - run `python local_classifier.py train` first")
+        for message in args.messages or [line.strip() for line in sys.stdin if line.strip()]:
+            verdict = model.classify(message)
+            decision = verdict["classification"] if verdict else "-> LLM"
+            print(f"P(SCAM)={model.probability(message):.3f}  {decision:7s} {message[:70]}")
+        return
+
+    rows = training_set(args.examples, args.log)
+    if len({label for _, label in rows}) < 2:
+        sys.exit("Need both SAFE and SCAM examples to train")
+    random.Random(7).shuffle(rows)
+    split = int(len(rows) * (1 - args.holdout)) if len(rows) >= 20 else len(rows)
+    train_rows, holdout_rows = rows[:split], rows[split:]
+
+    def fit(data):
+        return LocalClassifier(threshold=args.threshold).fit(
+            [t for t, _ in data], [1 if label == "SCAM" else 0 for _, label in data], epochs=args.epochs)
+
+    print(f"{len(rows)} labelled messages ({sum(1 for _, l in rows if l == 'SCAM')} SCAM), threshold {args.threshold}")
+    if holdout_rows:
+        decided, correct = evaluate(fit(train_rows), holdout_rows)
+        accuracy = f"{correct}/{decided} correct ({100 * correct / decided:.1f}%)" if decided else "n/a correct"
+        print(f"holdout: decided {decided}/{len(holdout_rows)} locally, {accuracy}")
+    else:
+        print("holdout: too little data for an honest estimate (need 20+ messages)")
+
+    model = fit(rows)
+    model.meta = {"trained_on": len(rows), "trained_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    model.save(args.out)
+    print(f"saved {args.out} ({len(model.weights)} weights)")
+
+    # What the cascade would have saved on the traffic the Gatekeeper actually saw
+    logged = load_labelled(args.log)
+    if logged:
+        model.decided = model.escalated = 0
+        decided, correct = evaluate(model, logged)
+        print(f"verdict log (in-sample): {decided}/{len(logged)} Gatekeeper calls avoidable "
+              f"({100 * decided / len(logged):.1f}%), {decided - correct} disagreements with the Gatekeeper")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# ==============================================================================
+# METRICS (PROMETHEUS TEXT FORMAT, NO EXTRA DEPENDENCY)
+# ==============================================================================
+# Small counters/histograms for the hot path, rendered on GET /metrics.
+#   - stage_timer("gatekeeper") times one stage and adds it to the current request's breakdown
+#   - track_request("chat") times a whole request; with TIMING_LOGS=1 it also prints
+#     one JSON line per request with the per-stage timings
+#   - startup_phase("import agent") records how long one part of the cold start took,
+#     shown on /healthz and as honeypot_startup_seconds
+# Everything is thread-safe: the GUVI reporter thread records metrics too.
+
+TIMING_LOGS = os.environ.get("TIMING_LOGS", "0") == "1"
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+_current_request = contextvars.ContextVar("current_request", default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.series = {}  # label key -> [bucket counts..., sum, count]
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, series in sorted(self.series.items()):
+                for i, bound in enumerate(self.buckets):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {series[i]}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]:.6f}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+class FunctionMetric:
+    """A gauge/counter read from existing state at scrape time. fn returns a number or {label value: number}."""
+
+    def __init__(self, name, help_text, fn, metric_type="gauge", label=None):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.type = metric_type
+        self.label = label
+        _registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        try:
+            value = self.fn()
+        except Exception as e:
+            return lines + [f"# error reading {self.name}: {e}"]
+        if isinstance(value, dict):
+            for label_value, number in sorted(value.items()):
+                lines.append(f"{self.name}{_format_labels(((self.label, label_value),))} {number}")
+        else:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- THE APP'S METRICS ---
+STAGE_SECONDS = Histogram("honeypot_stage_seconds", "Wall time per pipeline stage")
+REQUEST_SECONDS = Histogram("honeypot_request_seconds", "End-to-end wall time per request")
+LLM_TOKENS = Counter("honeypot_llm_tokens_total", "Tokens reported in Groq's usage field")
+LLM_ERRORS = Counter("honeypot_llm_errors_total", "Failed LLM calls (API errors, timeouts, rate limits)")
+JSON_ERRORS = Counter("honeypot_llm_json_errors_total", "LLM responses that were not valid JSON")
+DECISIONS = Counter("honeypot_decisions_total", "Who made the SAFE/SCAM decision (rule, cache, llm, session)")
+ESCALATIONS = Counter("honeypot_gatekeeper_escalations_total", "Small-model Gatekeeper answers re-asked on the big model")
+SPECULATION = Counter("honeypot_speculative_replies_total",
+                      "Mrs. Higgins replies started before the verdict (speculative / single_call), by outcome")
+WASTED_TOKENS = Counter("honeypot_wasted_tokens_total", "Estimated tokens spent on replies a SAFE verdict made useless")
+DEGRADED = Counter("honeypot_degraded_total", "Verdicts / replies made locally because the LLM was unavailable")
+REPORTS = Counter("honeypot_guvi_reports_total", "GUVI report outcomes")
+
+
+STARTUP = {}  # cold-start phase -> seconds
+FunctionMetric("honeypot_startup_seconds", "Time spent in each cold-start phase (imports, client setup, warm-up)",
+               lambda: {phase: round(seconds, 6) for phase, seconds in STARTUP.items()}, label="phase")
+
+
+@contextmanager
+def startup_phase(phase):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP[phase] = time.perf_counter() - started
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    request = _current_request.get()
+    if request is not None:
+        request["stages"][stage] = round(request["stages"].get(stage, 0.0) + seconds * 1000, 3)
+
+
+@contextmanager
+def stage_timer(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def record_usage(stage, usage):
+    if usage is None:
+        return
+    LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, stage=stage, kind="prompt")
+    LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, stage=stage, kind="completion")
+    request = _current_request.get()
+    if request is not None:
+        tokens = request.setdefault("tokens", {})
+        tokens[stage] = tokens.get(stage, 0) + (getattr(usage, "total_tokens", 0) or 0)
+
+
+def record_decision(decided_by):
+    # "rule:otp_sharing" -> source="rule", detail="otp_sharing"
+    source, _, detail = (decided_by or "none").partition(":")
+    DECISIONS.inc(source=source, detail=detail or source)
+
+
+@contextmanager
+def track_request(endpoint):
+    """Times a whole request. The yielded dict can be tagged (e.g. request["path"] = "SCAM")."""
+    request = {"endpoint": endpoint, "stages": {}}
+    previous = _current_request.get()
+    _current_request.set(request)
+    started = time.perf_counter()
+    try:
+        yield request
+    finally:
+        elapsed = time.perf_counter() - started
+        # set() rather than reset(token): a streaming response may be closed from another task
+        _current_request.set(previous)
+        REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, path=request.get("path", "unknown"))
+        if TIMING_LOGS:
+            request["total_ms"] = round(elapsed * 1000, 3)
+            print(json.dumps(request))
@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import queue
+import atexit
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+
+from metrics import stage_timer
+from extractor import IDENTIFIER_KEYS
+from background_writer import BackgroundWriter
+
+# ==============================================================================
+# THE OUTBOUND REPORTING QUEUE (GUVI)
+# ==============================================================================
+# /chat only drops a report on an in-memory queue and moves on. A background
+# worker thread owns a pooled requests.Session and does the slow part: timeouts,
+# retries with exponential backoff + jitter, and dropping repeat reports.
+# If the queue is full (or the endpoint is down for good) reports spill to a
+# local JSONL file and are replayed once the worker is idle again. Overflow from
+# /chat is spilled by a BackgroundWriter thread, so /chat never touches the disk.
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+def intelligence_fingerprint(intelligence, scope=None):
+    # Same identifiers in any order / case (within the same scope, e.g. session) = same report
+    canonical = {
+        key: sorted({str(v).strip().lower() for v in (intelligence or {}).get(key) or []})
+        for key in IDENTIFIER_KEYS
+    }
+    canonical["scope"] = scope
+    return hashlib.sha1(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+
+class GuviReporter:
+    def __init__(self, url, queue_size=1000, spill_file="guvi_spill.jsonl", timeout=10.0,
+                 max_retries=4, backoff_base=0.5, backoff_cap=30.0, dedupe_window=3600,
+                 spill_replay_interval=60):
+        self.url = url
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.spill_file = spill_file
+        self.timeout = (min(3.05, timeout), timeout)  # (connect, read)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.dedupe_window = dedupe_window
+        self.spill_replay_interval = spill_replay_interval
+
+        self.recent = OrderedDict()  # fingerprint -> time first reported
+        self.lock = threading.Lock()
+        self.thread = None
+        self.last_replay = 0.0
+
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.duplicates = 0
+        self.spilled = 0
+        self.dropped = 0
+        self.overflow = BackgroundWriter(self._spill, name="guvi-spill", queue_size=10 * queue_size)
+        atexit.register(self.spill_pending)
+
+    # --- PRODUCER SIDE (called from the request path, never blocks) ---
+    def submit(self, payload, dedupe_scope=None):
+        """Queues a report. Returns False if the same intelligence was already reported recently."""
+        fingerprint = intelligence_fingerprint(payload.get("extractedIntelligence"), dedupe_scope)
+        with self.lock:
+            now = time.monotonic()
+            while self.recent and next(iter(self.recent.values())) < now - self.dedupe_window:
+                self.recent.popitem(last=False)
+            if fingerprint in self.recent:
+                self.duplicates += 1
+                return False
+            self.recent[fingerprint] = now
+
+        self._ensure_worker()
+        try:
+            self.queue.put_nowait(payload)
+        except queue.Full:
+            if not self.overflow.put([payload]):
+                self.dropped += 1  # both queues full - lost rather than blocking /chat
+        return True
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "duplicates": self.duplicates,
+            "spilled": self.spilled,
+            "dropped": self.dropped,
+        }
+
+    # --- WORKER SIDE ---
+    def _ensure_worker(self):
+        if self.thread and self.thread.is_alive():
+            return
+        with self.lock:
+            if not (self.thread and self.thread.is_alive()):
+                self.thread = threading.Thread(target=self._run, name="guvi-reporter", daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        # requests is imported on the worker thread, so it stays off the app's startup path
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        while True:
+            try:
+                payload = self.queue.get(timeout=1.0)
+            except queue.Empty:
+                self._replay_spill()
+                continue
+            try:
+                self._deliver(session, payload)
+            finally:
+                self.queue.task_done()
+
+    def _deliver(self, session, payload):
+        import requests
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                with stage_timer("guvi_post"):
+                    response = session.post(self.url, json=payload, timeout=self.timeout)
+                print(f"REPORTING TO GUVI... Status: {response.status_code}")
+                if response.status_code not in RETRYABLE_STATUS:
+                    if response.ok:
+                        self.sent += 1
+                    else:
+                        self.failed += 1  # 4xx: retrying the same payload won't help
+                    return
+                retry_after = response.headers.get("Retry-After")
+            except requests.RequestException as e:
+                print(f"Failed to send report to GUVI: {e}")
+
+            if attempt < self.max_retries:
+                self.retries += 1
+                time.sleep(self._backoff(attempt, retry_after))
+
+        # Out of retries - keep it on disk for a later replay
+        self._spill([payload])
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_cap)
+        # "Full jitter": anywhere between 0 and the exponential ceiling
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    # --- SPILL FILE ---
+    def _spill(self, payloads, count=True):
+        with self.lock:
+            with open(self.spill_file, "a", encoding="utf-8") as f:
+                for payload in payloads:
+                    f.write(json.dumps(payload) + "\n")
+            if count:
+                self.spilled += len(payloads)
+
+    def _replay_spill(self):
+        now = time.monotonic()
+        if now - self.last_replay < self.spill_replay_interval or not os.path.exists(self.spill_file):
+            return
+        self.last_replay = now
+
+        replay_file = self.spill_file + ".replay"
+        with self.lock:
+            os.replace(self.spill_file, replay_file)
+        with open(replay_file, encoding="utf-8") as f:
+            payloads = [json.loads(line) for line in f if line.strip()]
+        os.remove(replay_file)
+
+        for i, payload in enumerate(payloads):
+            try:
+                self.queue.put_nowait(payload)
+            except queue.Full:
+                self._spill(payloads[i:], count=False)  # already counted the first time
+                break
+
+    def spill_pending(self):
+        """Writes whatever is still queued to the spill file (runs at interpreter exit)."""
+        self.overflow.flush()
+        pending = []
+        while True:
+            try:
+                pending.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if pending:
+            self._spill(pending)
@@ -0,0 +1,193 @@
+import re
+import sys
+
+from extractor import extract_intelligence, has_identifiers
+
+# ==============================================================================
+# THE RULE ENGINE (GATEKEEPER FAST PATH)
+# ==============================================================================
+# The hard rules from GATEKEEPER_PROMPT, compiled once at import time.
+# check_rules() runs before the Gatekeeper LLM. When a rule fires we already
+# know the answer, so we skip the 70B call entirely. Anything that is not an
+# obvious match returns None and goes to the LLM as before.
+# A SAFE verdict skips Mrs. Higgins too, so the SAFE rules only fire when the
+# message has nothing a scam needs: no link, number, UPI ID or account, no ask
+# for credentials or money, no threat or urgency. A sender header is just text
+# in the body (anyone can type "VM-HDFCBK:"), so it never makes a message SAFE
+# on its own.
+#
+# `python rules.py` checks the rules against KNOWN_CASES (and any messages given
+# on the command line are printed with the rule that fires, if any).
+
+# --- SENDER HEADERS ---
+# "VM-HDFCBK: ...", "VA-onTira: ...", "JM-BLUDRT-S: ..." (verified business IDs)
+VERIFIED_SENDER = re.compile(r"^\s*[A-Z]{2}-[A-Za-z0-9]{3,8}(?:-[A-Z])?\s*[:>\-]\s")
+# "+91 98765 43210: ..." (a personal mobile acting as the sender)
+PERSONAL_SENDER = re.compile(r"^\s*(?:\+?91[\s\-]?)?[6-9]\d{4}[\s\-]?\d{5}\s*[:>\-]\s")
+
+# --- POISON PILLS ---
+# Shortener domains only count with a path ("t.ly/abc"), so "T.LY shirt" isn't a link
+# and tunnels only as a host ("abc.ngrok-free.app"), so "the ngrok docs" isn't one either
+SHORTENER_LINK = re.compile(
+    r"\b(?:bit\.ly|tinyurl\.com|cutt\.ly|is\.gd|t\.ly|rb\.gy|shorturl\.at|goo\.gl|tiny\.cc)/\S"
+    r"|[\w\-]\.ngrok(?:-free)?\.(?:io|app|dev)\b",
+    re.IGNORECASE,
+)
+ANY_LINK = re.compile(r"(?:https?://|www\.)\S+|\b[a-z0-9\-]+\.(?:com|in|co|ly|io|app|net|org|xyz|link|me)(?:/\S*)?\b", re.IGNORECASE)
+MOBILE_NUMBER = re.compile(r"(?<!\d)(?:\+?91[\s\-]?)?[6-9]\d{4}[\s\-]?\d{5}(?!\d)")
+DANGEROUS_ATTACHMENT = re.compile(r"\.(?:exe|apk|scr|bat|msi)\b", re.IGNORECASE)
+
+# --- ZERO TOLERANCE ---
+# "Share OTP", "Tell us the PIN", "Give me the CVV"
+# ("code" is left to the LLM: showing a delivery code on the agent's scanner is SAFE;
+# so is a "PIN code", which is a postal code)
+SECRET_REQUEST = re.compile(
+    r"\b(share|send|tell|give|forward|provide|read out)\s+"
+    r"(?:(?:us|me|him|them|the|your|that|this|it|back)\s+){0,3}(otp|pin(?![\s\-]*code)|cvv|password)\b",
+    re.IGNORECASE,
+)
+# "We will never ask you to share your OTP", "Do not ever share it" - a negation anywhere
+# earlier in the same sentence makes the request a warning (or at least not obvious)
+NEGATION = re.compile(r"\bnot\b|n't\b|\bnever\b|\bno\s*one\b|\bnobody\b", re.IGNORECASE)
+SENTENCE_BREAK = re.compile(r"[.!?;\n]\s")
+# Where a clause ends: "Call me on 98xxx | when you reach the bank" is about two different things
+CLAUSE_BREAK = re.compile(r"[.!?;,\n]\s|\b(?:when|after|before|once|if|and|but|while|because|so)\b", re.IGNORECASE)
+CALL_TO_ACTION = re.compile(r"\b(call|contact|whatsapp|watsapp|message|msg|sms|ring|dial)\b", re.IGNORECASE)
+OFFICIAL_CONTEXT = frozenset({
+    "bank", "account", "kyc", "card", "upi", "electricity", "power", "bill", "sim",
+    "customer", "care", "support", "helpline", "official", "blocked", "disconnected",
+    "suspended", "refund", "delivery", "parcel", "courier", "sbi", "hdfc", "icici", "axis",
+})
+WORDS = re.compile(r"[a-z]+")
+
+# --- SAFE SIGNALS ---
+OTP_WARNING = re.compile(
+    r"\b(?:do\s*not|don't|dont|never)\s+(?:share|disclose|tell|give)\b", re.IGNORECASE
+)
+OTP_MENTION = re.compile(r"\b(?:otp|one[\s\-]time\s+password|verification\s+code)\b", re.IGNORECASE)
+# Anything a scam needs to get paid or get a secret - any of these sends a SAFE-looking message to the LLM
+RISK_SIGNAL = re.compile(
+    r"\b(?:cvv|pin|password|card\s*(?:no|number|details)|account\s*(?:no|number|details)|expiry|"
+    r"reply\s+with|ask(?:s)?\s+for|give\s+it|share\s+it|executive|"
+    r"pay|payment|transfer|deposit|fee|upi|refund|prize|lottery|"
+    r"block(?:ed)?|suspend(?:ed)?|disconnect(?:ed)?|deactivat\w*|arrest\w*|legal|penalty|"
+    r"urgent\w*|immediately|tonight|last\s+chance|within\s+\d+\s*(?:hours?|hrs?|minutes?|mins?))\b",
+    re.IGNORECASE,
+)
+
+RULE_CONFIDENCE = 99
+
+
+def _verdict(classification, rule, reason):
+    # Same shape as the Gatekeeper LLM's JSON, plus the rule that fired
+    return {
+        "classification": classification,
+        "reason": reason,
+        "confidence": RULE_CONFIDENCE,
+        "rule": rule,
+    }
+
+
+def _sentence_before(text, position):
+    breaks = [m.end() for m in SENTENCE_BREAK.finditer(text, 0, position)]
+    return text[breaks[-1] if breaks else 0:position]
+
+
+def _asks_for_secret(text):
+    # Any negated (or possibly negated) ask means we aren't sure - the Gatekeeper decides
+    matches = list(SECRET_REQUEST.finditer(text))
+    if any(NEGATION.search(_sentence_before(text, match.start())) for match in matches):
+        return False
+    return bool(matches)
+
+
+def _asks_to_call_officially(text):
+    # The mobile number, the call-to-action and the official word all in one clause
+    for clause in CLAUSE_BREAK.split(text):
+        if clause and MOBILE_NUMBER.search(clause) and CALL_TO_ACTION.search(clause) \
+                and set(WORDS.findall(clause.lower())) & OFFICIAL_CONTEXT:
+            return True
+    return False
+
+
+def check_rules(text):
+    """Returns a Gatekeeper-style verdict dict if a hard rule fires, else None."""
+    if not text:
+        return None
+
+    words = set(WORDS.findall(text.lower()))
+    has_mobile = bool(MOBILE_NUMBER.search(text))
+
+    # 1. POISON PILLS & ZERO TOLERANCE (checked first - they trump everything)
+    if _asks_for_secret(text):
+        return _verdict("SCAM", "otp_sharing", "Requests sharing of an OTP/PIN/code.")
+    if SHORTENER_LINK.search(text):
+        return _verdict("SCAM", "suspicious_link", "Contains a link shortener/tunnel (bit.ly, tinyurl, ngrok).")
+    if DANGEROUS_ATTACHMENT.search(text):
+        return _verdict("SCAM", "dangerous_attachment", "Asks to open an executable/APK attachment.")
+    if PERSONAL_SENDER.match(text) and words & OFFICIAL_CONTEXT:
+        return _verdict("SCAM", "personal_sender_official", "Official-sounding message sent from a personal mobile number.")
+    if has_mobile and _asks_to_call_officially(text):
+        return _verdict("SCAM", "personal_mobile_support", "Asks to call/message a personal mobile number about an official issue.")
+
+    # 2. SAFE CHECKLIST (only when there is nothing to click, call, pay or hand over)
+    if ANY_LINK.search(text) or has_mobile or CALL_TO_ACTION.search(text) or RISK_SIGNAL.search(text):
+        return None
+    if has_identifiers(extract_intelligence(text)):
+        return None
+    if OTP_MENTION.search(text) and OTP_WARNING.search(text):
+        return _verdict("SAFE", "transactional_otp", "Transactional OTP that warns NOT to share it.")
+    if VERIFIED_SENDER.match(text):
+        return _verdict("SAFE", "verified_sender", "Verified sender header, no links, numbers, payment or credential asks.")
+
+    return None
+
+
+# ==============================================================================
+# KNOWN CASES (`python rules.py`)
+# ==============================================================================
+# (message, expected verdict - None means "no rule fires, the Gatekeeper decides")
+KNOWN_CASES = [
+    ("Share your OTP with our executive to complete KYC", "SCAM"),
+    ("Click bit.ly/sbi-kyc to update your account", "SCAM"),
+    ("Contact SBI customer care 9876543210 to unblock your account", "SCAM"),
+    ("384921 is your OTP for transaction of Rs. 2,000.00. Do NOT share this OTP.", "SAFE"),
+    # anti-fraud warnings are not requests
+    ("We will never ask you to share your OTP or PIN", None),
+    ("SBI never asks customers to share OTP, PIN or CVV", None),
+    ("Do not ever share your OTP", None),
+    # a PIN code is a postal code; a delivery code on the agent's scanner is SAFE (the LLM's call)
+    ("Please send your PIN code so the courier can find you", None),
+    ("Give the code 4455 to the delivery agent on his scanner to receive your parcel", None),
+    # mentions, not links
+    ("Check the ngrok docs", None),
+    ("tinyurl is down again", None),
+    ("T.LY shirt in all sizes", None),
+    # the number and the official word are about different things
+    ("Call me on 9876543210 when you reach the bank", None),
+    # a header and a "do not share" don't make a scam SAFE
+    ("VM-HDFCBK: Your account is blocked. Reply with your card number and CVV to unblock.", None),
+    ("AD-ELECTR: Power will be disconnected tonight. Pay pending bill immediately using UPI id electricity.dept@okaxis", None),
+    ("Your OTP is 4455. Do not share it. Our executive will call and ask for it, please give it to him.", None),
+]
+
+
+def main():
+    for text in sys.argv[1:]:
+        verdict = check_rules(text)
+        print(f"{verdict['classification']} ({verdict['rule']})" if verdict else "no rule", "|", text)
+    if len(sys.argv) > 1:
+        return
+    failures = 0
+    for text, expected in KNOWN_CASES:
+        verdict = check_rules(text)
+        got = verdict["classification"] if verdict else None
+        if got != expected:
+            failures += 1
+            print(f"expected {expected}, got {got} ({verdict and verdict['rule']}): {text}")
+    print(f"{len(KNOWN_CASES) - failures}/{len(KNOWN_CASES)} known cases OK")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
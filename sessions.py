@@ -0,0 +1,153 @@
+import time
+from collections import OrderedDict
+
+from tokens import estimate_tokens
+
+# ==============================================================================
+# THE SESSION STORE (CONVERSATION MEMORY)
+# ==============================================================================
+# Keeps each conversation (keyed by the client's sessionId) in memory so that:
+#   - a scammer who was already caught stays caught on the next message,
+#   - Mrs. Higgins sees the recent conversation, trimmed to a fixed token budget,
+#   - GUVI reports carry the real session ID, message count and ALL identifiers so far.
+# Sessions are evicted least-recently-used, after an idle timeout, or when the
+# whole store goes over its memory cap.
+
+# What a session accumulates: the identifiers (extractor.IDENTIFIER_KEYS) plus keywords and IFSC codes
+SESSION_INTEL_KEYS = ["bankAccounts", "upiIds", "phishingLinks", "phoneNumbers", "suspiciousKeywords", "ifscCodes"]
+SESSION_OVERHEAD_BYTES = 512  # rough fixed cost of a Session object + its dicts
+TURN_OVERHEAD_BYTES = 96
+
+
+class Turn:
+    __slots__ = ("role", "text", "at")
+
+    def __init__(self, role, text):
+        self.role = role  # "scammer" or "agent"
+        self.text = text
+        self.at = time.time()
+
+
+class Session:
+    __slots__ = ("session_id", "turns", "message_count", "scam_detected", "intelligence",
+                 "created", "last_seen", "size")
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.turns = []
+        self.message_count = 0
+        self.scam_detected = False
+        self.intelligence = {key: [] for key in SESSION_INTEL_KEYS}
+        self.created = time.time()
+        self.last_seen = time.monotonic()
+        self.size = SESSION_OVERHEAD_BYTES
+
+    def merge_intelligence(self, intelligence):
+        added = 0
+        for key in SESSION_INTEL_KEYS:
+            known = self.intelligence[key]
+            for value in (intelligence or {}).get(key) or []:
+                if value not in known:
+                    known.append(value)
+                    self.size += len(str(value)) + 16
+                    added += 1
+        return added
+
+
+class SessionStore:
+    def __init__(self, max_sessions=10000, idle_timeout=1800, memory_cap_bytes=64 * 1024 * 1024,
+                 max_turns=50, history_token_budget=600):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.memory_cap_bytes = memory_cap_bytes
+        self.max_turns = max_turns
+        self.history_token_budget = history_token_budget
+        self.sessions = OrderedDict()  # session_id -> Session, least recently used first
+        self.total_bytes = 0
+        self.evictions = 0
+
+    def get_or_create(self, session_id):
+        self._evict_idle()
+        session = self.sessions.get(session_id)
+        if session:
+            self.sessions.move_to_end(session_id)
+        else:
+            session = Session(session_id)
+            self.sessions[session_id] = session
+            self.total_bytes += session.size
+            self._evict_over_limits()
+        session.last_seen = time.monotonic()
+        return session
+
+    def add_turn(self, session, role, text):
+        before = session.size
+        session.turns.append(Turn(role, text))
+        session.message_count += 1
+        session.size += len(text) + TURN_OVERHEAD_BYTES
+        # Only the recent turns can ever make it into the prompt - drop the rest
+        while len(session.turns) > self.max_turns:
+            dropped = session.turns.pop(0)
+            session.size -= len(dropped.text) + TURN_OVERHEAD_BYTES
+        self._resize(session, before)
+
+    def record_intelligence(self, session, intelligence):
+        before = session.size
+        session.merge_intelligence(intelligence)
+        self._resize(session, before)
+
+    def history_for_prompt(self, session, exclude_last=1):
+        """
+        Recent turns as prompt text, newest kept first, within history_token_budget.
+        Older turns are replaced by a one-line summary (count + identifiers already known).
+        """
+        turns = session.turns[:len(session.turns) - exclude_last] if exclude_last else session.turns
+        lines, used = [], 0
+        for turn in reversed(turns):
+            line = f"{'Scammer' if turn.role == 'scammer' else 'You'}: {turn.text}"
+            cost = estimate_tokens(line)
+            if used + cost > self.history_token_budget:
+                break
+            lines.append(line)
+            used += cost
+
+        skipped = (session.message_count - exclude_last) - len(lines)
+        if skipped > 0:
+            known = [v for key in ("upiIds", "phoneNumbers", "bankAccounts", "phishingLinks") for v in session.intelligence[key]]
+            summary = f"({skipped} earlier messages not shown"
+            summary += f"; they already gave you: {', '.join(known[:10])})" if known else ")"
+            lines.append(summary)
+        return "\n".join(reversed(lines))
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "bytes": self.total_bytes,
+            "evictions": self.evictions,
+        }
+
+    # --- EVICTION ---
+    def _resize(self, session, before):
+        if session.session_id in self.sessions:
+            self.total_bytes += session.size - before
+            self.sessions.move_to_end(session.session_id)
+        self._evict_over_limits()
+
+    def _remove(self, session_id):
+        session = self.sessions.pop(session_id)
+        self.total_bytes -= session.size
+        self.evictions += 1
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        while self.sessions:
+            oldest_id, oldest = next(iter(self.sessions.items()))
+            if oldest.last_seen >= cutoff:
+                break
+            self._remove(oldest_id)
+
+    def _evict_over_limits(self):
+        # Never evict the session we are currently working on (always the newest)
+        while len(self.sessions) > 1 and (
+            len(self.sessions) > self.max_sessions or self.total_bytes > self.memory_cap_bytes
+        ):
+            self._remove(next(iter(self.sessions)))
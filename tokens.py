@@ -0,0 +1,4 @@
+# Rough token count for budgeting prompts (~4 characters per token for English/Hinglish SMS).
+# Only used for sizing decisions; real counts come back in Groq's `usage` field.
+def estimate_tokens(text):
+    return len(text) // 4 + 1
@@ -0,0 +1,162 @@
+import re
+import time
+import random
+import hashlib
+from collections import OrderedDict
+
+# ==============================================================================
+# THE VERDICT CACHE (SCAM-TEMPLATE BLASTS)
+# ==============================================================================
+# Scam campaigns send thousands of copies of one template that only differ in
+# names, amounts and link suffixes. We normalize the message into a template
+# key, and index its word shingles with MinHash/LSH so "almost the same"
+# messages reuse the Gatekeeper's verdict instead of paying for another LLM call.
+# Near-duplicates only reuse SCAM verdicts: a known SAFE template with a link or
+# UPI ID appended is still ~70% the same text, and must go to the LLM.
+
+URL = re.compile(r"(?:https?://)?(?:www\.)?((?:[a-z0-9\-]+\.)+[a-z]{2,})(?:/\S*)?", re.IGNORECASE)
+AMOUNT = re.compile(r"(?:rs\.?|inr|₹)\s*[\d,]+(?:\.\d+)?", re.IGNORECASE)
+# Numbers are masked by type: a helpline and a personal mobile in the same template are different messages
+TOLL_FREE = re.compile(r"(?<!\d)18[06]0[\s\-]?\d{3}[\s\-]?\d{3,4}(?!\d)")
+MOBILE = re.compile(r"(?<![\d\w])(?:\+?91[\s\-]?|0)?[6-9]\d{4}[\s\-]?\d{5}(?!\d)")
+DIGITS = re.compile(r"\d+")
+NON_WORD = re.compile(r"[^\w<>#:.]+")
+
+# MinHash signature = BANDS x ROWS values. Two messages become candidates if any
+# band matches exactly; candidates are then checked with the real Jaccard score.
+BANDS = 8
+ROWS = 2
+MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(1337)  # fixed seed: signatures must be stable for the process lifetime
+PERMUTATIONS = [
+    (_rng.randrange(1, MERSENNE_PRIME), _rng.randrange(0, MERSENNE_PRIME)) for _ in range(BANDS * ROWS)
+]
+
+
+def normalize(text):
+    """Template form of a message: lowercased, URLs reduced to their domain, numbers masked by type."""
+    text = text.lower()
+    text = URL.sub(lambda m: f" <url:{m.group(1)}> ", text)  # keep the domain, drop the suffix
+    text = AMOUNT.sub(" <amt> ", text)
+    text = TOLL_FREE.sub(" <tollfree> ", text)
+    text = MOBILE.sub(" <mobile> ", text)
+    text = DIGITS.sub("#", text)
+    return " ".join(NON_WORD.sub(" ", text).split())
+
+
+def shingles(normalized):
+    # Words + word pairs, hashed to 64-bit ints
+    tokens = normalized.split()
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    return frozenset(
+        int.from_bytes(hashlib.blake2b(f.encode(), digest_size=8).digest(), "big") for f in features
+    )
+
+
+def lsh_bands(features):
+    if not features:
+        return []
+    signature = [min((a * h + b) % MERSENNE_PRIME for h in features) for a, b in PERMUTATIONS]
+    return [(i, tuple(signature[i * ROWS:(i + 1) * ROWS])) for i in range(BANDS)]
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class VerdictCache:
+    def __init__(self, max_size=10000, ttl=3600, near_threshold=0.7, prompt_version=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.near_threshold = near_threshold  # min Jaccard similarity for a near-duplicate, 0 = exact only
+        self.prompt_version = prompt_version
+        self.entries = OrderedDict()  # key -> (verdict, shingles, bands, expires_at)
+        self.band_index = {}          # (band, values) -> set of keys
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    # --- LOOKUP ---
+    def get(self, text):
+        key = normalize(text)
+        entry = self._live_entry(key)
+        if entry:
+            self.hits += 1
+            return entry[0]
+
+        if self.near_threshold > 0:
+            features = shingles(key)
+            best, best_score = None, self.near_threshold
+            for candidate in self._candidates(lsh_bands(features)):
+                entry = self._live_entry(candidate)
+                if not entry or entry[0].get("classification") != "SCAM":
+                    continue
+                score = jaccard(entry[1], features)
+                if score >= best_score:
+                    best, best_score = entry, score
+            if best:
+                self.near_hits += 1
+                return best[0]
+
+        self.misses += 1
+        return None
+
+    def put(self, text, verdict):
+        key = normalize(text)
+        if key in self.entries:
+            self._remove(key)
+        features = shingles(key)
+        bands = lsh_bands(features)
+        self.entries[key] = (verdict, features, bands, time.monotonic() + self.ttl)
+        for band in bands:
+            self.band_index.setdefault(band, set()).add(key)
+        while len(self.entries) > self.max_size:
+            self._remove(next(iter(self.entries)))  # least recently used
+
+    # --- MAINTENANCE ---
+    def invalidate(self, prompt_version=None):
+        """Drops every cached verdict (call this whenever GATEKEEPER_PROMPT changes)."""
+        self.entries.clear()
+        self.band_index.clear()
+        if prompt_version is not None:
+            self.prompt_version = prompt_version
+
+    def stats(self):
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.near_hits) / lookups, 4) if lookups else 0.0,
+            "prompt_version": self.prompt_version,
+        }
+
+    # --- INTERNALS ---
+    def _live_entry(self, key):
+        entry = self.entries.get(key)
+        if not entry:
+            return None
+        if entry[3] < time.monotonic():
+            self._remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _candidates(self, bands):
+        # Collected up front: checking a candidate may evict it from the index
+        candidates = set()
+        for band in bands:
+            candidates.update(self.band_index.get(band, ()))
+        return list(candidates)
+
+    def _remove(self, key):
+        _, _, bands, _ = self.entries.pop(key)
+        for band in bands:
+            keys = self.band_index.get(band)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self.band_index[band]